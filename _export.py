@@ -2,184 +2,353 @@
     Export module.
 """
 
-import sys
+import dataclasses
 import logging
 from pathlib import Path
 import utils
 import grid_objects
 import api
 import urls
-import time
 import strategy
 import configs
+import record_cache
+import json_stream
 import xml.etree.ElementTree as ET
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from api import HTTP_STATUS
 from typing import Dict
 from requests import Response
 
 DEFAULT_XML_EXPORT_STRATEGY = strategy.DefaultXmlExportStrategy()
 DEFAULT_JSON_EXPORT_STRATEGY = strategy.DefaultJsonExportStrategy()
+TOTAL_COUNT_HEADER = 'X-Total-Count'
+RECORD_BATCH_SIZE = 100
 
 logger = logging.getLogger(__name__)
 
+
+class FetchError(Exception):
+    """
+        A page of the grid could not be fetched, so the grid is not exported.
+    """
+
 #####
-# Validate properties in setup.yml
+# Build the page into every root mapped to the grid
 #####
-def __validate_config(config_properties):
-    if 'api-key' not in config_properties:
-        logger.error("api-key is missing. Please add 'api-key' property in setup.yml.")
-        sys.exit()
-
-    if 'export' not in config_properties:
-        logger.error("export configurations are missing. Please add 'export' property in setup.yml.")
-        sys.exit()
+def __build_page(records, builders: Dict, hashes=None):
+    """
+            Split the cells of the records by column in one pass,
+            and hand the builders of each column the records with only its cells
+    """
+    column_records = {column_id: [] for column_id in builders}
+    for record in records:
+        column_cells = {column_id: [] for column_id in builders}
+        for cell in record['cells']:
+            cells = column_cells.get(cell['columnId'])
+            if cells is not None:
+                cells.append(cell)
+        for column_id, cells in column_cells.items():
+            column_records[column_id].append(dict(record, cells=cells))
+
+    for column_id, column_builders in builders.items():
+        if hashes is not None:
+            column_hashes = hashes.setdefault(column_id, {})
+            for record in column_records[column_id]:
+                column_hashes[record['id']] = record_cache.hash_value(record['cells'])
+        for export_strategy, root in column_builders:
+            export_strategy.build(root, column_records[column_id])
 
-    if 'directory' not in config_properties['export']:
-        logger.error("export directory is missing. Please add 'export.directory' property in setup.yml.")
-        sys.exit()
+#####
+# Fetch one page
+#####
+def __fetch_page(api_key, url):
+    """
+            Fetch the url, too many requests are retried by the api.
+            The body is not read yet, so the records can be parsed while they are received
+    """
+    response = api.get(api_key, url, stream=True)
+    if response.status_code == HTTP_STATUS['OK']:
+        return response
+    elif response.status_code == HTTP_STATUS['TOO_MANY_REQUESTS']:
+        logger.error(f'Request to {urls.unquote(url)} has reached maximum of retries')
+    else:
+        logger.error(
+            f'Request to {urls.unquote(url)} has returned code {response.status_code}, details: {response.text}')
+    response.close()
+    return None
 
-    if 'grids' not in config_properties['export']:
-        logger.error("export grid(s) is missing. Please add 'export.grids' property in setup.yml.")
-        sys.exit()
+#####
+# Read the records of a page as they are received
+#####
+def __iter_batches(response: Response):
+    """
+            Yield the records of the page in small batches, parsed while the body is downloaded
+    """
+    with response:
+        chunks = response.iter_content(chunk_size=api.STREAM_BLOCK_SIZE)
+        batch = []
+        for record in json_stream.iter_array_items(json_stream.TextChunks(chunks, response.encoding or 'utf-8')):
+            batch.append(record)
+            if len(batch) >= RECORD_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
-    grids = config_properties['export']['grids']
-    for grid in grids:
-        if 'name' not in grid:
-            logger.error("grid name is missing. Please add 'export.grids.name' in setup.yml")
-            sys.exit()
-        if 'view-id' not in grid:
-            logger.error("grid view-id is missing. Please add 'export.grids.view-id' in setup.yml")
-            sys.exit()
+#####
+# Get total number of records in the grid
+#####
+def __get_total_count(response: Response):
+    if TOTAL_COUNT_HEADER not in response.headers:
+        return None
+    try:
+        return int(response.headers[TOTAL_COUNT_HEADER])
+    except ValueError:
+        return None
 
-    if 'files' not in config_properties['export']:
-        logger.error("file(s) is missing. Please add 'export.files' in setup.yml")
-        sys.exit()
+#####
+# Download one page
+#####
+def __download_page(api_key, url):
+    """
+            Fetch the page with its raw body, so the connection goes back to the pool while the page waits
+    """
+    response = __fetch_page(api_key, url)
+    if response is not None:
+        response.content
+    return response
 
-    if 'mappings' not in config_properties['export']['files']:
-        logger.error("file mapping(s) is missing. Please add 'export.files.mappings' in setup.yml")
-        sys.exit()
+#####
+# Stop the grid at the first page which failed
+#####
+def __get_page(response, view_id):
+    if response is None:
+        raise FetchError(f'Failed to fetch the records of view {view_id}')
+    return response
 
-    file_mappings = config_properties['export']['files']['mappings']
-    file_path = (".xml", ".json")
-    for file_mapping in file_mappings:
-        if 'file-name' not in file_mapping:
-            logger.error("file-name is missing. Please add 'export.files.mappings.file-name' in setup.yml")
-            sys.exit()
+#####
+# Iterate the remaining pages of the grid by offset
+#####
+def __iter_prefetched_pages(api_key, view_id, column_ids, limit, total):
+    """
+            Download the next pages at the same time and parse them in order
+    """
+    prefetch_pages = configs.prefetch_pages()
+    with ThreadPoolExecutor(max_workers=prefetch_pages) as executor:
+        pending = deque()
+        for offset in range(limit, total, limit):
+            url = urls.get_record_url(view_id, column_ids, grid_objects.Page(limit, offset))
+            pending.append(executor.submit(__download_page, api_key, url))
 
-        if 'file-name' in file_mapping and not file_mapping['file-name'].endswith(file_path):
-            logger.error("file must be json file. Please add 'export.files.mappings.file-name' in setup.yml")
-            sys.exit()
+            # Parse the oldest page while the newer ones are downloading
+            if len(pending) >= prefetch_pages:
+                yield from __iter_batches(__get_page(pending.popleft().result(), view_id))
 
-        if 'column-id' not in file_mapping:
-            logger.error("column-id is missing. Please add 'export.files.mappings.column-id' in setup.yml")
-            sys.exit()
+        while pending:
+            yield from __iter_batches(__get_page(pending.popleft().result(), view_id))
 
 #####
-# Paste the response
+# Iterate the records of the grid
 #####
-def __parse_response(response: Response, root: Dict, api_key, url, retry_times):
+def __iter_pages(api_key, view_id, column_ids, limit):
     """
-            Paste response
+            Yield the records of the grid in small batches, page after page
     """
-    config_properties = utils.load_yml_file('config/setup.yml')
-    __validate_config(config_properties)
+    url = urls.get_record_url(view_id, column_ids, grid_objects.Page(limit))
+    response = __get_page(__fetch_page(api_key, url), view_id)
 
-    file_mappings = config_properties['export']['files']['mappings']
+    total = __get_total_count(response)
+    url = response.links.get('next', {}).get('url')
+    yield from __iter_batches(response)
 
-    if retry_times >= configs.max_fetch_retry():
-        logger.error(f'Request to {urls.unquote(url)} has reached maximum of retries')
+    if total is not None and configs.prefetch_pages() > 1:
+        yield from __iter_prefetched_pages(api_key, view_id, column_ids, limit, total)
         return
 
-    if response.status_code == HTTP_STATUS['OK']:
-        records = response.json()
-        for file_mapping in file_mappings:
-            if 'file-name' in file_mapping and file_mapping['file-name'].endswith('.xml'):
-                DEFAULT_XML_EXPORT_STRATEGY.build(root, records)
-            elif 'file-name' in file_mapping and file_mapping['file-name'].endswith('.json'):
-                DEFAULT_JSON_EXPORT_STRATEGY.build(root, records)
-            else: 
-                logger.warning("Stupid man ...")
-
-        if 'Link' in response.headers and 'next' in response.links:
-            url = response.links['next']['url']
-            response = api.get(api_key, url)
-            __parse_response(response, root, api_key, url, 0)
-
-    elif response.status_code == HTTP_STATUS['TOO_MANY_REQUESTS']:
-        time.sleep(1)
-        response = api.get(api_key, url)
-        __parse_response(response, root, api_key, url, retry_times + 1)
-
-    else:
-        logger.error(
-            f'Request to {urls.unquote(url)} has returned code {response.status_code}, details: {response.text}')
+    # Total is unknown, follow the next links one page at a time
+    while url:
+        response = __get_page(__fetch_page(api_key, url), view_id)
+        url = response.links.get('next', {}).get('url')
+        yield from __iter_batches(response)
 
 #####
-# Export the grid content to xml/json file(s)
+# Fetch all mapped columns of a grid in one pass
 #####
-def export():
+def __fetch_grid(api_key, grid, file_mappings, hashes=None):
     """
-        Export data from grids in setup.yml to xml/json file(s)
+            Fetch records of the grid into one new root per file mapping,
+            and the hash of each record by column when hashes is given
     """
-    config_properties = utils.load_yml_file('config/setup.yml')
-    __validate_config(config_properties)
+    roots = []
+    # Builders of each column, (strategy, root)
+    builders = {}
+    for file_mapping in file_mappings:
+        column_builders = builders.setdefault(file_mapping.column_id, [])
+        if file_mapping.file_name.endswith('.xml'):
+            root = ET.Element("texts")
+            column_builders.append((DEFAULT_XML_EXPORT_STRATEGY, root))
+        elif file_mapping.file_name.endswith('.json'):
+            root = {}
+            column_builders.append((DEFAULT_JSON_EXPORT_STRATEGY, root))
+        else:
+            root = None
+        roots.append(root)
 
-    api_key = config_properties['api-key']
-    export_properties = config_properties['export']
-    grids = export_properties['grids']
-    file_mappings = export_properties['files']['mappings']
-    export_directory = export_properties['directory']
+    builders = {column_id: column_builders for column_id, column_builders in builders.items() if column_builders}
+    if builders:
+        column_ids = list(builders)
+        limit = grid.page_size or configs.fetch_limit()
+        for records in __iter_pages(api_key, grid.view_id, column_ids, limit):
+            __build_page(records, builders, hashes)
 
-    utils.create_dir_if_not_exists(export_directory)
+    return roots
 
-    combine = True
-    if 'combine' in export_properties:
-        combine = export_properties['combine']
+#####
+# Merge a json root into another one, keeping existing values
+#####
+def __merge_json(target: Dict, source: Dict):
+    for key, value in source.items():
+        if key not in target:
+            target[key] = value
+        elif isinstance(target[key], dict) and isinstance(value, dict):
+            __merge_json(target[key], value)
+    return target
 
-    # Start export file
-    for file_mapping in file_mappings:
-        column_id = file_mapping['column-id']
-        file_name = file_mapping['file-name']
-        
-        # Check the file format before export the data to the file
-        if 'file-name' in file_mapping and file_mapping['file-name'].endswith('.xml'):
-            root = ET.Element("texts")
-            for grid in grids:
-                url = urls.get_record_url(grid['view-id'], [column_id], grid_objects.Page(configs.fetch_limit()))
-                response = api.get(api_key, url)
-                __parse_response(response, root, api_key, url, 0)
+#####
+# Check whether the exported file can be kept as it is
+#####
+def __is_up_to_date(cache, changed_columns, export_path, file_mapping, grids):
+    if cache is None or not utils.does_file_exist(export_path):
+        return False
 
-                export_path = f"{export_directory}/{grid['name']}_{file_name}"
-                utils.dump_to_xml_file(export_path, root)
-                root = ET.Element("texts")
+    column_id = file_mapping.column_id
+    if any(changed_columns.get((grid.view_id, column_id), True) for grid in grids):
+        return False
 
-                logger.info(f'Exported data to {export_path}')
-        elif 'file-name' in file_mapping and file_mapping['file-name'].endswith('.json'):
-            root = {}
-            for grid in grids:
-                url = urls.get_record_url(grid['view-id'], [column_id], grid_objects.Page())
-                response = api.get(api_key, url)
-                __parse_response(response, root, api_key, url, 0)
+    if cache.get_file_signature(export_path) != __get_signature(file_mapping, grids):
+        return False
 
-                if not combine:
-                    if 'lang' in file_mapping:
-                        root.setdefault('name', file_mapping['lang'])
+    logger.info(f'{export_path} is up to date')
+    return True
 
-                    export_path = f"{export_directory}/{grid['name']}_{file_name}"
-                    utils.dump_to_json_file(export_path, root)
-                    root = {}
+#####
+# Signature of the settings an exported file was written with
+#####
+def __get_signature(file_mapping, grids):
+    return record_cache.hash_value([dataclasses.asdict(file_mapping), [grid.view_id for grid in grids]])
 
-                    logger.info(f'Exported data to {export_path}')
 
-            if combine:
-                if 'lang' in file_mapping:
-                    root.setdefault('name', file_mapping['lang'])
+def __save_signature(cache, export_path, file_mapping, grids):
+    if cache:
+        cache.save_file_signature(export_path, __get_signature(file_mapping, grids))
+
+#####
+# Export the grid content to xml/json file(s)
+#####
+def export(setup: configs.SetupConfig = None):
+    """
+        Export data from grids in setup.yml to xml/json file(s)
+    """
+    setup = setup or configs.setup()
+    if setup.export_config is None:
+        raise configs.ConfigError("export configurations are missing. Please add 'export' property in setup.yml.")
+
+    api_key = setup.api_key
+    export_config = setup.export_config
+    grids = export_config.grids
+    file_mappings = export_config.mappings
+    export_directory = export_config.directory
+
+    utils.create_dir_if_not_exists(export_directory)
 
+    combine = export_config.combine
+
+    # Only rewrite the files whose records changed since the last export
+    cache = None
+    if export_config.cache:
+        cache = record_cache.RecordCache(export_config.cache)
+
+    # Fetch the grids at the same time, then write the results in configuration order
+    combined_roots = [{} for _ in file_mappings]
+    grid_hashes = [{} if cache else None for _ in grids]
+    changed_columns = {}
+    failed_grids = []
+    with ThreadPoolExecutor(max_workers=configs.export_max_workers()) as executor:
+        fetches = [executor.submit(__fetch_grid, api_key, grid, file_mappings, hashes)
+                   for grid, hashes in zip(grids, grid_hashes)]
+
+        for grid, hashes, fetch in zip(grids, grid_hashes, fetches):
+            try:
+                roots = fetch.result()
+            except FetchError as error:
+                # Keep the files of the last export rather than write them incomplete
+                logger.error(f'{error}, the files of grid {grid.name} are not exported')
+                failed_grids.append(grid)
+                continue
+            if cache:
+                for column_id, column_hashes in hashes.items():
+                    changed_columns[(grid.view_id, column_id)] = \
+                        cache.get_export_records(grid.view_id, column_id) != column_hashes
+
+            for file_mapping, root, combined_root in zip(file_mappings, roots, combined_roots):
+                file_name = file_mapping.file_name
+
+                # Check the file format before export the data to the file
+                if file_name.endswith('.xml'):
+                    export_path = f"{export_directory}/{grid.name}_{file_name}"
+                    if __is_up_to_date(cache, changed_columns, export_path, file_mapping, [grid]):
+                        continue
+                    utils.dump_to_xml_file(export_path, root)
+                    __save_signature(cache, export_path, file_mapping, [grid])
+
+                    logger.info(f'Exported data to {export_path}')
+                elif file_name.endswith('.json'):
+                    if combine:
+                        __merge_json(combined_root, root)
+                    else:
+                        export_path = f"{export_directory}/{grid.name}_{file_name}"
+                        if __is_up_to_date(cache, changed_columns, export_path, file_mapping, [grid]):
+                            continue
+                        if file_mapping.lang is not None:
+                            root.setdefault('name', file_mapping.lang)
+
+                        utils.dump_to_json_file(export_path, root)
+                        __save_signature(cache, export_path, file_mapping, [grid])
+
+                        logger.info(f'Exported data to {export_path}')
+                else:
+                    logger.warning("Please stop it!!!!")
+
+    if combine and failed_grids:
+        logger.error('The combined json files are not exported, as some grids failed')
+        # The records of the other grids are saved, so the combined files are written again next time
+        if cache:
+            for file_mapping in file_mappings:
+                if file_mapping.file_name.endswith('.json'):
+                    cache.save_file_signature(f"{export_directory}/{file_mapping.file_name}", '')
+    elif combine:
+        for file_mapping, root in zip(file_mappings, combined_roots):
+            file_name = file_mapping.file_name
+            if file_name.endswith('.json'):
                 export_path = f"{export_directory}/{file_name}"
+                if __is_up_to_date(cache, changed_columns, export_path, file_mapping, grids):
+                    continue
+                if file_mapping.lang is not None:
+                    root.setdefault('name', file_mapping.lang)
+
                 utils.dump_to_json_file(export_path, root)
+                __save_signature(cache, export_path, file_mapping, grids)
 
                 logger.info(f'Exported data to {export_path}')
-        else:
-            logger.warning("Please stop it!!!!")
 
+    # Remember the exported records once every file is written. A grid which failed keeps the records of its
+    # last export, like its files
+    if cache:
+        for grid, hashes in zip(grids, grid_hashes):
+            if grid in failed_grids:
+                continue
+            for column_id, column_hashes in hashes.items():
+                cache.save_export_records(grid.view_id, column_id, column_hashes)
+        cache.close()
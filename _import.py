@@ -2,212 +2,399 @@
     Import module.
 """
 
-import sys
-from pathlib import Path
+import os
+import time
+import traceback
+import multiprocessing
+from queue import Empty
+from concurrent.futures import ProcessPoolExecutor
 import utils
 import api
 import urls
 import strategy
 import logging
 import configs
+import uploader
+import record_cache
 from api import HTTP_STATUS
+from record_cache import ImportState
+from grid_router import GridRouter
+from file_mappings import FileMappings
 
 DEFAULT_XML_IMPORT_STRATEGY = strategy.DefaultXmlImportStrategy()
 DEFAULT_JSON_IMPORT_STRATEGY = strategy.DefaultJsonImportStrategy()
 DEFAULT_PO_IMPORT_STRATEGY = strategy.DefaultPoImportStrategy()
+PARSE_BATCH_SIZE = 500
 logger = logging.getLogger(__name__)
 
+# Queue of a parse process to send the records back, and event telling it to stop
+__parse_queue = None
+__parse_stop = None
+
 #####
-# Validate properties in setup.yml
+# Get file(s) to import
 #####
-def __validate_config(config_properties):
-    if 'api-key' not in config_properties:
-        logger.error("api-key is missing. Please add 'api-key' property in setup.yml.")
-        sys.exit()
+def __get_files_to_import(base_dir, file_mappings: FileMappings):
+    """
+            (file name, file mapping) of every mapping of the files of the directory, read in one pass
+    """
+    files_return = []
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(('.xml', '.json', '.po')):
+                for file_mapping in file_mappings.get(entry.name):
+                    files_return.append((entry.name, file_mapping))
 
-    if 'import' not in config_properties:
-        logger.error("import configurations are missing. Please add 'import' property in setup.yml.")
-        sys.exit()
+    return files_return
 
-    if 'data-directory' not in config_properties['import']:
-        logger.error("import data-directory is missing. Please add 'import.data-directory' property in setup.yml.")
-        sys.exit()
+#####
+# Do post request
+#####
+def __do_post(api_key, grid, records):
+    """
+            Create the records, return whether it succeeded and the bytes sent
+    """
+    url = urls.set_record_url(grid.view_id)
+    response = api.post_json(api_key, url, records)
+    if response.status_code == HTTP_STATUS['CREATED']:
+        logger.info(f'Successfully create {len(response.json())} record(s)')
+        return True, len(response.request.body or b'')
 
-    if 'grids' not in config_properties['import']:
-        logger.error("import grid(s) is missing. Please add 'import.grids' property in setup.yml.")
-        sys.exit()
+    elif response.status_code == HTTP_STATUS['NOT_FOUND']:
+        logger.error(
+            f'Failed create records for grid {grid.name}, return-code: {response.status_code}, details: {response.text}')
+        exit()
+    else:
+        logger.error(
+            f'Failed create records for grid {grid.name}, return-code: {response.status_code}, details: {response.text}')
+    return False, len(response.request.body or b'')
+
+#####
+# Do patch request
+#####
+def __do_patch(api_key, grid, records):
+    """
+            Update the records, return whether it succeeded and the bytes sent
+    """
+    url = urls.set_record_url(grid.view_id)
+    response = api.patch_json(api_key, url, records)
+    if response.status_code == HTTP_STATUS['OK']:
+        logger.info(f'Successfully update {len(records)} record(s)')
+        return True, len(response.request.body or b'')
 
-    grids = config_properties['import']['grids']
-    has_default_grid = False
-    for grid in grids:
-        if 'name' not in grid:
-            logger.error("grid name is missing. Please add 'import.grids.name' in setup.yml")
-            sys.exit()
-        if 'view-id' not in grid:
-            logger.error("grid view-id is missing. Please add 'import.grids.view-id' in setup.yml")
-            sys.exit()
-        if 'default' in grid:
-            has_default_grid = grid['default']
+    elif response.status_code == HTTP_STATUS['NOT_FOUND']:
+        logger.error(
+            f'Failed update records for grid {grid.name}, return-code: {response.status_code}, details: {response.text}')
+        exit()
+    else:
+        logger.error(
+            f'Failed update records for grid {grid.name}, return-code: {response.status_code}, details: {response.text}')
+    return False, len(response.request.body or b'')
 
-    if not has_default_grid:
-        logger.error("Default grid is missing. Please set one grid with 'import.grids.default=true' in setup.yml")
-        sys.exit()
+#####
+# Upload a chunk, new records are created and changed ones updated
+#####
+def __do_upload(api_key, grid, records, change, import_state, tuners=None):
+    start = time.monotonic()
+    if change == ImportState.CHANGED:
+        succeeded, payload_bytes = __do_patch(api_key, grid, records)
+    else:
+        succeeded, payload_bytes = __do_post(api_key, grid, records)
 
-    if 'files' not in config_properties['import']:
-        logger.error("file(s) is missing. Please add 'import.files' in setup.yml")
-        sys.exit()
+    if tuners is not None:
+        tuners[grid.view_id].add(len(records), time.monotonic() - start, payload_bytes, succeeded)
 
-    if 'mappings' not in config_properties['import']['files']:
-        logger.error("file mapping(s) is missing. Please add 'import.files.mappings' in setup.yml")
-        sys.exit()
+    if succeeded and import_state is not None:
+        import_state.save(grid.view_id, records)
+    return succeeded
 
-    file_mappings = config_properties['import']['files']['mappings']
-    file_path = (".xml", ".json", ".po")
-    for file_mapping in file_mappings:
-        if 'file-name' not in file_mapping:
-            logger.error("file-name is missing. Please add 'import.files.mappings.file-name' in setup.yml")
-            sys.exit()
+#####
+# Get the number of records to send per request to the grid
+#####
+def __get_chunk_size(grid, tuners=None):
+    if tuners is not None:
+        return tuners[grid.view_id].size
+    return grid.chunk_size or configs.import_chunk_size()
 
-        if 'file-name' in file_mapping and not file_mapping['file-name'].endswith(file_path):
-            logger.error("file must be json file. Please add 'import.files.mappings.file-name' in setup.yml")
-            sys.exit()
+#####
+# Extract the records of a file
+#####
+def __extract_records(import_directory, file_name, column_id, repeated=None):
+    """
+            Records of the file, xml and json are extracted while they are read.
+            The leaves of the keys repeated in a json file are put in repeated when given
+    """
+    # Check the file format before import the data to the grid
+    if '.xml' in file_name:
+        events = utils.iter_xml_file(f"{import_directory}/{file_name}")
+        return DEFAULT_XML_IMPORT_STRATEGY.stream(column_id, events)
+    elif '.json' in file_name:
+        leaves = utils.iter_json_file(f"{import_directory}/{file_name}", repeated)
+        return DEFAULT_JSON_IMPORT_STRATEGY.stream(column_id, leaves)
+    elif '.po' in file_name:
+        data = utils.load_po_file(f"{import_directory}/{file_name}")
+        dict = {}
+        for entry in data:
+            key = entry.msgid
+            value = entry.msgstr
+            dict[key] = value
+
+        return DEFAULT_PO_IMPORT_STRATEGY.read(column_id, dict, '')
+
+    logger.warning("Something went wrong!")
+    return None
 
-        if 'column-id' not in file_mapping:
-            logger.error("column-id is missing. Please add 'import.files.mappings.column-id' in setup.yml")
-            sys.exit()
+#####
+# Queue the records chunk by chunk as they are extracted
+#####
+def __queue_records(chunk_uploader, router, records, chunks, import_state=None, tuners=None, overwrite=False):
+    """
+            Add the records to the chunks being filled, a [grid, records] by change and grid,
+            and submit the chunks which are full. Records to overwrite are posted whatever their last import
+    """
+    for record in records:
+        grid = router.route(record.id)
+
+        change = ImportState.NEW
+        if import_state is not None:
+            change = import_state.get_change(grid.view_id, record)
+            if overwrite:
+                change = ImportState.NEW
+            elif change is None:
+                continue
+
+        key = (change, grid.view_id)
+        chunk = chunks.get(key)
+        if chunk is None:
+            chunk = chunks[key] = [grid, []]
+
+        chunk[1].append(record)
+        if len(chunk[1]) >= __get_chunk_size(grid, tuners):
+            chunk_uploader.submit(grid, chunk[1], change, import_state)
+            chunk[1] = []
 
 #####
-# Get file(s) to import
+# Submit the chunks which are not full yet
 #####
-def __get_files_to_import(base_dir, file_mappings):
-    base_path = Path(base_dir)
-    files_in_base_path = base_path.iterdir()
+def __flush_chunks(chunk_uploader, chunks, import_state=None):
+    for (change, _), (grid, records) in chunks.items():
+        if records:
+            chunk_uploader.submit(grid, records, change, import_state)
+    chunks.clear()
 
-    files_return = []
-    for item in files_in_base_path:
-        if item.is_file() and item.suffix in ('.xml', '.json', '.po') and not __get_file_mapping(item.name, file_mappings) is None:
-            files_return.append(item)
+#####
+# Import the records of a file
+#####
+def __import_records(chunk_uploader, router, records, import_state=None, tuners=None):
+    chunks = {}
+    __queue_records(chunk_uploader, router, records, chunks, import_state, tuners)
+    __flush_chunks(chunk_uploader, chunks, import_state)
 
-    return files_return
+#####
+# Import the last value of the keys repeated in a json file
+#####
+def __import_repeated(chunk_uploader, router, column_id, repeated, file_name, import_state=None, tuners=None):
+    """
+            The records of the first value were submitted already. They are posted again with the last value
+            once they are uploaded, as json.load keeps the last one
+    """
+    if not repeated:
+        return
+
+    logger.warning(f'{len(repeated)} value(s) of keys repeated in {file_name} are imported again with their last value')
+    chunk_uploader.wait()
+    records = DEFAULT_JSON_IMPORT_STRATEGY.stream(column_id, repeated.items())
+    chunks = {}
+    __queue_records(chunk_uploader, router, records, chunks, import_state, tuners, overwrite=True)
+    __flush_chunks(chunk_uploader, chunks, import_state)
 
 #####
-# Get file(s) mapping
+# Remember what the file holds after its import
 #####
-def __get_file_mapping(file_name, file_mappings):
-    for file_mapping in file_mappings:
-        if file_mapping['file-name'] == file_name:
-            return file_mapping
-    return None
+def __forget_removed(import_state, file_name):
+    if import_state:
+        removed = import_state.forget_removed()
+        if removed:
+            logger.warning(f'{len(removed)} record(s) were removed from {file_name} since the last import, '
+                           f'they are kept in the grid')
 
 #####
-# Get grid in Gridly
+# Set up a process of the parse pool
 #####
-def __get_grid_to_import(record_id, grids):
-    default_grid = None
-    for grid in grids:
-        if not grid.get('default', False):
-            if 'path' in grid and grid['path'] in record_id:
-                return grid
-        else:
-            default_grid = grid
+def __init_parse_worker(queue, stop):
+    global __parse_queue, __parse_stop
+    # Every batch is read before the end of its file, a process left with unread batches was stopped
+    queue.cancel_join_thread()
+    __parse_queue = queue
+    __parse_stop = stop
 
-    return default_grid
+#####
+# Parse a file in a process of the parse pool
+#####
+def __parse_file(index, import_directory, file_name, column_id):
+    """
+            Send (index, records) to the importing process batch by batch, (index, repeated leaves) when a json
+            file repeats keys, then (index, None) once done or (index, error) when the file cannot be parsed.
+            Stop early when the import is stopped
+    """
+    try:
+        batch = []
+        repeated = {}
+        for record in __extract_records(import_directory, file_name, column_id, repeated) or []:
+            batch.append(record)
+            if len(batch) >= PARSE_BATCH_SIZE:
+                if __parse_stop.is_set():
+                    return
+                __parse_queue.put((index, batch))
+                batch = []
+        if batch:
+            __parse_queue.put((index, batch))
+        if repeated:
+            __parse_queue.put((index, repeated))
+        __parse_queue.put((index, None))
+    except Exception:
+        __parse_queue.put((index, traceback.format_exc()))
 
 #####
-# Do post request
+# Import files parsed at the same time by a pool of processes
 #####
-def __do_post(api_key, grid, records):
-    url = urls.set_record_url(grid['view-id'])
-    response = api.post_json(api_key, url, records)
-    if response.status_code == HTTP_STATUS['CREATED']:
-        logger.info(f'Successfully create {len(response.json())} record(s)')
+def __import_files_in_parallel(chunk_uploader, router, import_directory, files, cache=None, tuners=None):
+    """
+            The records of every file are chunked and uploaded here as their batches come back
+    """
+    parse_workers = min(configs.import_parse_workers(), len(files))
+    queue = multiprocessing.Queue(maxsize=parse_workers * 4)
+    import_states = [ImportState(cache, file_name, file_mapping.column_id) if cache else None
+                     for file_name, file_mapping in files]
+    chunks = [{} for _ in files]
+
+    stop = multiprocessing.Event()
+    executor = ProcessPoolExecutor(max_workers=parse_workers, initializer=__init_parse_worker,
+                                   initargs=(queue, stop))
+    parses = []
+    try:
+        for index, (file_name, file_mapping) in enumerate(files):
+            logger.info(f'Importing file {file_name}...')
+            parses.append(executor.submit(__parse_file, index, import_directory, file_name, file_mapping.column_id))
+
+        remaining = len(files)
+        while remaining:
+            try:
+                index, message = queue.get(timeout=1)
+            except Empty:
+                # A process which died cannot send its end
+                for parse in parses:
+                    if parse.done() and parse.exception() is not None:
+                        raise parse.exception()
+                continue
+
+            if isinstance(message, list):
+                __queue_records(chunk_uploader, router, message, chunks[index], import_states[index], tuners)
+                continue
+
+            file_name, file_mapping = files[index]
+            __flush_chunks(chunk_uploader, chunks[index], import_states[index])
+            if isinstance(message, dict):
+                __import_repeated(chunk_uploader, router, file_mapping.column_id, message, file_name,
+                                  import_states[index], tuners)
+                continue
+
+            remaining -= 1
+            if message is None:
+                __forget_removed(import_states[index], file_name)
+            else:
+                logger.error(f'Failed to parse {file_name}: {message}')
+    except BaseException:
+        __stop_parse_workers(queue, stop, parses)
+        raise
+    finally:
+        executor.shutdown()
 
-    elif response.status_code == HTTP_STATUS['NOT_FOUND']:
-        logger.error(
-            f'Failed create records for grid {grid["name"]}, return-code: {response.status_code}, details: {response.text}')
-        exit()
-    else:
-        logger.error(
-            f'Failed create records for grid {grid["name"]}, return-code: {response.status_code}, details: {response.text}')
-    records.clear()
+#####
+# Stop the parse pool when the import failed
+#####
+def __stop_parse_workers(queue, stop, parses):
+    """
+            Parses not started are cancelled, running ones stop at their next batch. Their batches are
+            drained meanwhile, so that no process stays blocked on the full queue
+    """
+    stop.set()
+    for parse in parses:
+        parse.cancel()
+    while not all(parse.done() for parse in parses):
+        try:
+            queue.get(timeout=0.1)
+        except Empty:
+            pass
 
 #####
 # Import xml/json file(s) to a grid in Gridly
 #####
-def import_data():
-    config_properties = utils.load_yml_file('config/setup.yml')
-    __validate_config(config_properties)
-
-    api_key = config_properties['api-key']
-    import_properties = config_properties['import']
-    file_properties = import_properties['files']
-    grids = import_properties['grids']
-    import_directory = import_properties['data-directory']
-    file_mappings = file_properties['mappings']
+def import_data(setup: configs.SetupConfig = None, file_names=None):
+    """
+        Import the mapped files of data-directory, or only the ones in file_names when given
+    """
+    setup = setup or configs.setup()
+    if setup.import_config is None:
+        raise configs.ConfigError("import configurations are missing. Please add 'import' property in setup.yml.")
+
+    api_key = setup.api_key
+    import_config = setup.import_config
+    grids = import_config.grids
+    import_directory = import_config.data_directory
+    file_mappings = import_config.mappings
+
+    # Only send the records which changed since the last import
+    cache = None
+    if import_config.cache:
+        cache = record_cache.RecordCache(import_config.cache)
+
+    # Tune the chunk size of each grid to the throughput of its requests
+    tuners = None
+    if configs.chunk_auto_tune():
+        tuners = {grid.view_id: uploader.ChunkSizeTuner(
+            __get_chunk_size(grid), configs.chunk_min_size(), configs.chunk_max_size(),
+            configs.chunk_max_payload_bytes()) for grid in grids}
+
+    # Chunks are posted by the workers while the next ones are extracted
+    chunk_uploader = uploader.ChunkUploader(
+        lambda grid, records, change, import_state: __do_upload(api_key, grid, records, change, import_state, tuners),
+        configs.import_max_workers())
+
+    # Grids are looked up by the path of the records
+    router = GridRouter(grids)
+
+    files = __get_files_to_import(import_directory, FileMappings(file_mappings))
+    if file_names is not None:
+        files = [(file_name, file_mapping) for file_name, file_mapping in files if file_name in file_names]
 
     # Start import file
-    files_to_import = __get_files_to_import(import_directory, file_mappings)
-    for file in files_to_import:
-        logger.info(f'Importing file {file.name}...')
-
-        file_name = file.name
-        
-        # Check the file format before import the data to the grid
-        if '.xml' in file.name:
-            data = utils.load_xml_file(f"{import_directory}/{file_name}")
-
-            file_mapping = __get_file_mapping(file_name, file_mappings)
-            if file_mapping is None:
-                return
-
-            extracted_records = DEFAULT_XML_IMPORT_STRATEGY.read(file_mapping['column-id'], data, '')
-        elif '.json' in file.name:
-            data = utils.load_json_file(f"{import_directory}/{file_name}")
-            
-            file_mapping = __get_file_mapping(file_name, file_mappings)
-            if file_mapping is None:
-                return
-
-            extracted_records = DEFAULT_JSON_IMPORT_STRATEGY.read(file_mapping['column-id'], data, '')
-        elif '.po' in file.name:
-            data = utils.load_po_file(f"{import_directory}/{file_name}")
-            dict = {}
-            for entry in data:
-                key = entry.msgid 
-                value = entry.msgstr
-                dict[key] = value
-
-            file_mapping = __get_file_mapping(file_name, file_mappings)
-            if file_mapping is None:
-                return
-
-            extracted_records = DEFAULT_PO_IMPORT_STRATEGY.read(file_mapping['column-id'], dict, '')
-        else: 
-            logger.warning("Something went wrong!")
-
-        length = len(extracted_records)
-        if length == 0:
-            return
-
-        record = extracted_records[0]
-        current_grid = __get_grid_to_import(record.id, grids)
-        working_records = [record]
-
-        loop = 1
-        while loop < length:
-            record = extracted_records[loop]
-            grid = __get_grid_to_import(record.id, grids)
-
-            if grid != current_grid:
-                __do_post(api_key, current_grid, working_records)
-                current_grid = grid
-
-            if len(working_records) >= configs.import_chunk_size():
-                __do_post(api_key, current_grid, working_records)
-
-            working_records.append(extracted_records[loop])
-
-            loop += 1
-
-        if working_records:
-            __do_post(api_key, current_grid, working_records)
+    if configs.import_parse_workers() > 1 and len(files) > 1:
+        __import_files_in_parallel(chunk_uploader, router, import_directory, files, cache, tuners)
+    else:
+        for file_name, file_mapping in files:
+            logger.info(f'Importing file {file_name}...')
+
+            repeated = {}
+            extracted_records = __extract_records(import_directory, file_name, file_mapping.column_id, repeated)
+            if extracted_records is None:
+                continue
+
+            import_state = None
+            if cache:
+                import_state = ImportState(cache, file_name, file_mapping.column_id)
+
+            __import_records(chunk_uploader, router, extracted_records, import_state, tuners)
+            __import_repeated(chunk_uploader, router, file_mapping.column_id, repeated, file_name,
+                              import_state, tuners)
+            __forget_removed(import_state, file_name)
+
+    report = chunk_uploader.close()
+    if cache:
+        cache.close()
+    logger.info(f'Import done: {report}')
+    if tuners is not None:
+        for grid in grids:
+            logger.info(f'Chunk size of grid {grid.name} tuned to {tuners[grid.view_id].size} record(s)')
+    if report.failed_chunks:
+        logger.error(f'{report.failed_records} record(s) in {report.failed_chunks} chunk(s) were not imported')
@@ -0,0 +1,100 @@
+"""
+    Upload module.
+"""
+
+import os
+import time
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import utils
+import api
+import urls
+import configs
+import record_cache
+from api import HTTP_STATUS
+
+UPLOADED = 'uploaded'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+#####
+# Get file(s) to upload
+#####
+def __get_files_to_upload(base_dir, view_id, file_mappings):
+    """
+        (file path, view id, record id, column id) of every file matching a mapping
+    """
+    base_path = Path(base_dir)
+    files_return = []
+    for file_mapping in file_mappings:
+        for item in sorted(base_path.glob(file_mapping.pattern)):
+            if item.is_file():
+                # File name without its extension, the whole name when it has none
+                record_id = item.stem
+                files_return.append((str(item), file_mapping.view_id or view_id, record_id, file_mapping.column_id))
+
+    return files_return
+
+#####
+# Upload a file to its record and column
+#####
+def __upload_file(api_key, file_to_upload, cache):
+    file_path, view_id, record_id, column_id = file_to_upload
+
+    file_hash = None
+    if cache:
+        file_hash = utils.hash_file(file_path)
+        if cache.get_uploaded_file_hash(view_id, record_id, column_id) == file_hash:
+            logger.debug(f'{file_path} is already uploaded')
+            return SKIPPED, 0
+
+    url = urls.add_binary_file_url(view_id, record_id, column_id)
+    response = api.post_binary_file(api_key, url, file_path)
+    if response.status_code in (HTTP_STATUS['OK'], HTTP_STATUS['CREATED']):
+        if cache:
+            cache.save_uploaded_file_hash(view_id, record_id, column_id, file_hash)
+        return UPLOADED, os.path.getsize(file_path)
+
+    logger.error(
+        f'Failed upload {file_path} to record {record_id}, return-code: {response.status_code}, details: {response.text}')
+    return FAILED, 0
+
+#####
+# Upload binary file(s) to the file columns of a grid in Gridly
+#####
+def upload_files(setup: configs.SetupConfig = None):
+    setup = setup or configs.setup()
+    if setup.upload_config is None:
+        raise configs.ConfigError("upload configurations are missing. Please add 'upload' property in setup.yml.")
+
+    api_key = setup.api_key
+    upload_config = setup.upload_config
+
+    cache = None
+    if upload_config.cache:
+        cache = record_cache.RecordCache(upload_config.cache)
+
+    files_to_upload = __get_files_to_upload(upload_config.directory, upload_config.view_id, upload_config.mappings)
+    logger.info(f'Uploading {len(files_to_upload)} file(s)...')
+
+    results = {UPLOADED: 0, SKIPPED: 0, FAILED: 0}
+    uploaded_bytes = 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=configs.upload_max_workers()) as executor:
+        uploads = [executor.submit(__upload_file, api_key, file_to_upload, cache) for file_to_upload in files_to_upload]
+        for upload in as_completed(uploads):
+            result, size = upload.result()
+            results[result] += 1
+            uploaded_bytes += size
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    megabytes = uploaded_bytes / 1048576
+    logger.info(f'Uploaded {results[UPLOADED]} file(s), {megabytes:.1f} MB in {elapsed:.1f}s '
+                f'({results[UPLOADED] / elapsed:.1f} files/s, {megabytes / elapsed:.2f} MB/s), '
+                f'{results[SKIPPED]} unchanged, {results[FAILED]} failed')
+
+    if cache:
+        cache.close()
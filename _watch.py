@@ -0,0 +1,62 @@
+"""
+    Watch module.
+"""
+
+import dataclasses
+import logging
+import api
+import configs
+import watcher
+import _import
+from file_mappings import FileMappings
+
+logger = logging.getLogger(__name__)
+
+#####
+# Import the files of data-directory again whenever they are written
+#####
+def watch(setup: configs.SetupConfig = None):
+    """
+        Keep running and import the mapped files written to data-directory, until interrupted.
+        script.yml and setup.yml are loaded again when they change.
+    """
+    setup = setup or configs.setup()
+    if setup.import_config is None:
+        raise configs.ConfigError("import configurations are missing. Please add 'import' property in setup.yml.")
+
+    directory = setup.import_config.data_directory
+    file_watcher = watcher.open_watcher(directory, configs.watch_interval())
+    logger.info(f'Watching {directory} for changes, press Ctrl+C to stop')
+    try:
+        while True:
+            file_names = watcher.wait_changes(file_watcher, configs.watch_settle())
+
+            try:
+                if configs.reload():
+                    logger.info('Configuration changed, it is loaded again')
+                    new_setup = configs.setup()
+                    # The changed files are in the watched directory, so its import configuration is kept
+                    if new_setup.import_config is None or new_setup.import_config.data_directory != directory:
+                        logger.warning('import.data-directory changed, the previous import configuration is kept. '
+                                       'Restart to watch the new directory')
+                        new_setup = dataclasses.replace(new_setup, import_config=setup.import_config)
+                    setup = new_setup
+                    # Pool and rate limits of script.yml are applied to a new client
+                    api.close()
+            except configs.ConfigError as error:
+                logger.error(f'{error}. The previous configuration is kept')
+
+            file_mappings = FileMappings(setup.import_config.mappings)
+            file_names = {file_name for file_name in file_names if file_mappings.get(file_name)}
+            if not file_names:
+                continue
+
+            logger.info(f'Importing changed file(s): {", ".join(sorted(file_names))}')
+            try:
+                _import.import_data(setup, file_names)
+            except Exception:
+                logger.exception('Import of the changed file(s) failed')
+    except KeyboardInterrupt:
+        logger.info('Stopped watching')
+    finally:
+        file_watcher.close()
@@ -2,9 +2,19 @@
 This module implements the Requests API.
 """
 
+import gzip
+import io
+import os
+import random
+import threading
+import uuid
+import time
 import requests
 import logging
 import utils
+import configs
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 from urls import unquote
 
 HTTP_STATUS = {
@@ -13,8 +23,254 @@ HTTP_STATUS = {
     'TOO_MANY_REQUESTS': 429,
     'NOT_FOUND': 404
 }
+STREAM_BLOCK_SIZE = 65536
+GZIP_LEVEL = 6
 logger = logging.getLogger(__name__)
 
+__client = None
+__client_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+        Client-side rate limiting shared by all requests of the run.
+
+        A token bucket caps the request rate, and the number of requests in flight follows AIMD:
+        it is halved on every HTTP 429 and raised by one after as many successes as the current limit.
+        Retry-After of a throttled response pauses every request until it has passed.
+    """
+
+    def __init__(self, rate=0, burst=1, max_concurrency=8):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.__tokens = self.burst
+        self.__updated = time.monotonic()
+        self.__in_flight = 0
+        self.__successes = 0
+        self.__paused_until = 0
+        self.__condition = threading.Condition()
+
+    def acquire(self):
+        """ Wait for a token and a free slot to send a request.
+        """
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                if self.rate > 0:
+                    self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+                self.__updated = now
+
+                if now < self.__paused_until:
+                    timeout = self.__paused_until - now
+                elif self.__in_flight >= self.concurrency:
+                    timeout = None
+                elif self.rate > 0 and self.__tokens < 1:
+                    timeout = (1 - self.__tokens) / self.rate
+                else:
+                    if self.rate > 0:
+                        self.__tokens -= 1
+                    self.__in_flight += 1
+                    return
+                self.__condition.wait(timeout)
+
+    def release(self, throttled=False, retry_after=None, failed=False):
+        """ Free the slot and adapt the concurrency to the response.
+            A request which failed without a response leaves the concurrency as it is.
+        """
+        with self.__condition:
+            self.__in_flight -= 1
+            if throttled:
+                self.concurrency = max(1, self.concurrency // 2)
+                self.__successes = 0
+                if retry_after:
+                    self.__paused_until = max(self.__paused_until, time.monotonic() + retry_after)
+            elif not failed:
+                self.__successes += 1
+                if self.__successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self.__successes = 0
+            self.__condition.notify_all()
+
+
+class MultipartFile:
+    """
+        multipart/form-data body with a single file, read from disk while it is sent.
+    """
+
+    def __init__(self, field_name, file_name, binary_file, content_type=None):
+        boundary = uuid.uuid4().hex
+        file_name = file_name.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+        head = f'--{boundary}\r\nContent-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+        if content_type:
+            head += f'Content-Type: {content_type}\r\n'
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self.__parts = [io.BytesIO((head + '\r\n').encode('utf8')), binary_file,
+                        io.BytesIO(f'\r\n--{boundary}--\r\n'.encode('utf8'))]
+        self.__length = len(self.__parts[0].getvalue()) + os.fstat(binary_file.fileno()).st_size + \
+            len(self.__parts[2].getvalue())
+        self.__index = 0
+
+    def __len__(self):
+        return self.__length
+
+    def __iter__(self):
+        return iter(lambda: self.read(STREAM_BLOCK_SIZE), b'')
+
+    def seek(self, offset):
+        for part in self.__parts:
+            part.seek(0)
+        self.__index = 0
+
+    def read(self, size=-1):
+        data = b''
+        while self.__index < len(self.__parts) and (size < 0 or len(data) < size):
+            chunk = self.__parts[self.__index].read(size - len(data) if size >= 0 else -1)
+            if chunk:
+                data += chunk
+            else:
+                self.__index += 1
+        return data
+
+
+class Client:
+    """
+        Pooled, keep-alive HTTP client shared by import and export.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, rate_limiter=None, accept_encoding='gzip, deflate'):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = accept_encoding
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.__headers = {}
+
+    def headers(self, api_key, content_type='application/json', content_encoding=None):
+        """ Default headers for the api key, built once and reused.
+
+            :return: Dict
+        """
+        key = (api_key, content_type, content_encoding)
+        headers = self.__headers.get(key)
+        if headers is None:
+            headers = {'Authorization': f'ApiKey {api_key}'}
+            if content_type:
+                headers['Content-Type'] = content_type
+            if content_encoding:
+                headers['Content-Encoding'] = content_encoding
+            self.__headers[key] = headers
+        return headers
+
+    def close(self):
+        self.session.close()
+
+
+def client():
+    """ Get the client shared for the whole run, created on first use.
+
+        :return: api.Client
+    """
+    global __client
+    if __client is None:
+        with __client_lock:
+            if __client is None:
+                rate_limiter = RateLimiter(configs.rate_limit_per_second(), configs.rate_limit_burst(),
+                                           configs.rate_limit_max_concurrency())
+                __client = Client(configs.http_pool_connections(), configs.http_pool_maxsize(), rate_limiter,
+                                  configs.http_accept_encoding())
+    return __client
+
+
+def close():
+    """ Close the shared client and its pooled connections.
+    """
+    global __client
+    with __client_lock:
+        if __client is not None:
+            __client.close()
+            __client = None
+
+
+def __get_retry_after(response):
+    """ Seconds to wait from the Retry-After or X-RateLimit-Reset header of the response.
+    """
+    value = response.headers.get('Retry-After')
+    if value is not None:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    value = response.headers.get('X-RateLimit-Reset')
+    if value is not None:
+        try:
+            reset = float(value)
+        except ValueError:
+            return None
+        # Either an epoch time or a number of seconds
+        return max(0.0, reset - time.time()) if reset > 1e9 else reset
+    return None
+
+
+def __send(method, url, **kwargs):
+    """ Send the request through the rate limiter, retrying with backoff when too many requests.
+
+        :return: requests.Response
+    """
+    shared_client = client()
+    max_retries = configs.max_fetch_retry()
+    for attempt in range(max_retries + 1):
+        # A streamed body is sent again from its start
+        if hasattr(kwargs.get('data'), 'seek'):
+            kwargs['data'].seek(0)
+
+        shared_client.rate_limiter.acquire()
+        throttled = False
+        retry_after = None
+        failed = True
+        try:
+            response = shared_client.session.request(method, url, **kwargs)
+            failed = False
+            throttled = response.status_code == HTTP_STATUS['TOO_MANY_REQUESTS']
+            if throttled:
+                retry_after = __get_retry_after(response)
+        finally:
+            shared_client.rate_limiter.release(throttled, retry_after, failed)
+
+        if not throttled or attempt == max_retries:
+            return response
+        # Give the connection of a streamed response back to the pool
+        response.close()
+
+        # Exponential backoff with full jitter unless the server said how long to wait
+        delay = retry_after
+        if delay is None:
+            delay = random.uniform(0, min(configs.rate_limit_max_backoff(), configs.rate_limit_backoff() * 2 ** attempt))
+        logger.warning(f'Too many requests to {unquote(url)}, retry {attempt + 1}/{max_retries} in {delay:.2f}s')
+        time.sleep(delay)
+
+
+def __send_json(method, api_key, url, json_string):
+    """ Send the json, gzipped when compression is on and the body is big enough.
+
+        :return: requests.Response
+    """
+    body = json_string.encode('utf8')
+    content_encoding = None
+    if configs.http_compress_requests() and len(body) >= configs.http_compress_min_size():
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        logger.debug(f'Compressed payload from {len(body)} to {len(compressed)} bytes')
+        body = compressed
+        content_encoding = 'gzip'
+
+    return __send(method, url, headers=client().headers(api_key, content_encoding=content_encoding), data=body)
+
 
 def post_json(api_key, url, json_data):
     """ POST json request the specified url.
@@ -25,13 +281,12 @@ def post_json(api_key, url, json_data):
 
         :return: requests.Response
     """
-    json_string = utils.encode_to_json(json_data)
+    json_string = utils.encode_to_json(json_data, configs.json_backend())
 
     logger.info(f'Post data to {unquote(url)}')
     logger.debug(f'payload = {json_string}')
 
-    headers = {'Authorization': f'ApiKey {api_key}', 'Content-Type': 'application/json'}
-    response = requests.post(url, headers=headers, data=json_string)
+    response = __send_json('POST', api_key, url, json_string)
     return response
 
 
@@ -44,20 +299,20 @@ def patch_json(api_key, url, json_data):
 
         :return: requests.Response
     """
-    json_string = utils.encode_to_json(json_data)
+    json_string = utils.encode_to_json(json_data, configs.json_backend())
 
     logger.info(f'Patch data to {unquote(url)}')
     logger.debug(f'payload = {json_string}')
 
-    headers = {'Authorization': f'ApiKey {api_key}', 'Content-Type': 'application/json'}
-    response = requests.patch(url, headers=headers, data=json_string)
+    response = __send_json('PATCH', api_key, url, json_string)
     return response
 
 
-def get(api_key, url):
+def get(api_key, url, stream=False):
     """ GET data from the specified url.
 
         :param api_key: (required)
+        :param stream: read the body while it is received, compressed bodies are decoded on the fly
 
         Usage::
 
@@ -65,13 +320,12 @@ def get(api_key, url):
     """
     logger.info(f'Get data from {unquote(url)}')
 
-    headers = {'Authorization': f'ApiKey {api_key}', 'Content-Type': 'application/json'}
-    response = requests.get(url, headers=headers)
+    response = __send('GET', url, headers=client().headers(api_key), stream=stream)
     return response
 
 
 def post_binary_file(api_key, url, file_path):
-    """ GET data from the specified url.
+    """ POST a file to the specified url, streamed from disk.
 
         :param api_key: (required)
 
@@ -81,10 +335,8 @@ def post_binary_file(api_key, url, file_path):
     """
     logger.info(f'Post binary file to {unquote(url)}')
 
-    headers = {'Authorization': f'ApiKey {api_key}'}
-
-    files = [
-        ('file', (utils.get_file_name(file_path), open(file_path, 'rb'), utils.get_content_type(file_path)))
-    ]
-    response = requests.post(url, headers=headers, files=files)
+    with open(file_path, 'rb') as binary_file:
+        body = MultipartFile('file', utils.get_file_name(file_path), binary_file, utils.get_content_type(file_path))
+        headers = dict(client().headers(api_key, None), **{'Content-Type': body.content_type})
+        response = __send('POST', url, headers=headers, data=body)
     return response
@@ -0,0 +1,206 @@
+"""
+    Benchmark import, export and upload against a local mock of the Gridly API.
+
+    Generates a grid shaped like games/bigstrings.cs.xml (about 8000 phrases) and multiples of it,
+    as an xml and a json file, then runs _import.import_data, _export.export and _upload.upload_files
+    each in its own process, from a temporary directory holding config/ and the data.
+    Reports records/s, requests, bytes sent and received, and peak RSS of every run.
+
+    $ python benchmarks/bench_import_export.py --scales 1 10 --latency 0.02 --rate-429 0.01
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import yaml
+
+from mock_gridly import MockGridly
+
+PHRASES = 7986
+VIEW_ID = 'bench'
+PHASES = ('import', 'export', 'upload')
+
+
+#####
+# Synthetic data
+#####
+def phrase_path(i):
+    """
+        Nested groups like the ones of bigstrings.cs.xml
+    """
+    return ['MMO', f'area{i % 8}', f'group{i % 80}', f'sub{i % 640}']
+
+
+def write_xml(path, phrases):
+    with open(path, 'w', encoding='utf8') as xml_file:
+        xml_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<texts>\n')
+        for i in range(phrases):
+            groups = ''.join(f'<group name="{name}">' for name in phrase_path(i))
+            xml_file.write(f'  {groups}<phrase name="phrase{i}" text="Poskytuje bonus %modifier% % k obraně {i}" />'
+                           f'{"</group>" * len(phrase_path(i))}\n')
+        xml_file.write('</texts>\n')
+
+
+def write_json(path, phrases):
+    root = {}
+    for i in range(phrases):
+        node = root
+        for name in phrase_path(i):
+            node = node.setdefault(name, {})
+        node[f'phrase{i}'] = f'Donne un bonus de %modifier% % à la défense {i}'
+    with open(path, 'w', encoding='utf8') as json_file:
+        json.dump(root, json_file, ensure_ascii=False)
+
+
+def write_files(directory, count, size):
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        (directory / f'asset{i}.bin').write_bytes(os.urandom(size))
+
+
+def write_workspace(directory, mock_url, phrases, files, file_size):
+    """
+        config/ and data of one run, script.yml is the one of the repo pointed at the mock
+    """
+    config_dir = directory / 'config'
+    config_dir.mkdir()
+    script = yaml.safe_load((REPO_DIR / 'config' / 'script.yml').read_text(encoding='utf8'))
+    script['gridly-url'] = mock_url
+    script['log'] = {'level': 'WARNING', 'mode': 'CONSOLE'}
+    (config_dir / 'script.yml').write_text(yaml.safe_dump(script), encoding='utf8')
+
+    setup = {
+        'api-key': 'bench',
+        'import': {
+            'data-directory': 'data',
+            'grids': [{'name': 'Bench', 'view-id': VIEW_ID, 'default': True}],
+            'files': {'mappings': [
+                {'file-name': 'strings.xml', 'column-id': 'csCZ'},
+                {'file-name': 'strings.json', 'column-id': 'frFR'},
+            ]},
+        },
+        'export': {
+            'directory': 'export',
+            'grids': [{'name': 'Bench', 'view-id': VIEW_ID}],
+            'files': {'mappings': [
+                {'file-name': 'strings.xml', 'column-id': 'csCZ'},
+                {'file-name': 'strings.json', 'column-id': 'frFR'},
+            ]},
+        },
+        'upload': {
+            'directory': 'assets',
+            'view-id': VIEW_ID,
+            'mappings': [{'pattern': '*.bin', 'column-id': 'audio'}],
+        },
+    }
+    (config_dir / 'setup.yml').write_text(yaml.safe_dump(setup, sort_keys=False), encoding='utf8')
+
+    data_dir = directory / 'data'
+    data_dir.mkdir()
+    write_xml(data_dir / 'strings.xml', phrases)
+    write_json(data_dir / 'strings.json', phrases)
+    write_files(directory / 'assets', files, file_size)
+
+
+#####
+# Run one phase in a child process, from the workspace
+#####
+def run_child(phase):
+    import api
+    import configs
+    import _export
+    import _import
+    import _upload
+
+    configs.init()
+    start = time.perf_counter()
+    try:
+        if phase == 'import':
+            _import.import_data()
+        elif phase == 'export':
+            _export.export()
+        else:
+            _upload.upload_files()
+    finally:
+        api.close()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'seconds': elapsed, 'peak_rss': peak_rss()}))
+
+
+def peak_rss():
+    """
+        Peak resident memory of this process in bytes
+    """
+    # ru_maxrss of Linux keeps the peak of the parent process across exec, VmHWM does not
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_phase(mock, workspace, phase):
+    before = mock.stats.snapshot()
+    output = subprocess.run([sys.executable, str(Path(__file__).resolve()), '--child', phase], cwd=workspace,
+                            check=True, stdout=subprocess.PIPE, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    after = mock.stats.snapshot()
+    result.update({name: after[name] - before[name] for name in after})
+    return result
+
+
+def print_result(scale, phase, result):
+    if phase == 'import':
+        count = result['records_in']
+    elif phase == 'export':
+        count = result['records_out']
+    else:
+        count = result['files']
+    print(f"{scale:>5}x {phase:<7} {count:>9} {result['seconds']:>8.2f} {count / result['seconds']:>10.0f} "
+          f"{result['requests']:>8} {result['throttled']:>5} {result['bytes_in'] / 1048576:>8.1f} "
+          f"{result['bytes_out'] / 1048576:>8.1f} {result['peak_rss'] / 1048576:>8.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark import, export and upload against a local mock of Gridly')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10], help='Grid sizes, in bigstrings.cs.xml')
+    parser.add_argument('--phases', nargs='+', choices=PHASES, default=list(PHASES), help='Runs to benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request by the mock')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Share of requests answered with HTTP 429')
+    parser.add_argument('--no-total-count', action='store_true', help='Page with Link headers only')
+    parser.add_argument('--files', type=int, default=50, help='Number of files to upload per scale')
+    parser.add_argument('--file-size', type=int, default=262144, help='Bytes per uploaded file')
+    parser.add_argument('--child', choices=PHASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        sys.exit()
+
+    print(f"{'scale':>6} {'run':<7} {'items':>9} {'seconds':>8} {'items/s':>10} {'requests':>8} {'429s':>5} "
+          f"{'sent MB':>8} {'recv MB':>8} {'RSS MB':>8}")
+    for scale in args.scales:
+        with MockGridly(latency=args.latency, rate_429=args.rate_429, total_count=not args.no_total_count) as mock, \
+                tempfile.TemporaryDirectory(prefix='gridly-bench-') as workspace:
+            write_workspace(Path(workspace), mock.url, PHRASES * scale, args.files * scale, args.file_size)
+            # Export and upload work on the records and grid left by the import
+            for phase in PHASES:
+                if phase in args.phases or (phase == 'import' and 'export' in args.phases):
+                    result = run_phase(mock, workspace, phase)
+                    if phase in args.phases:
+                        print_result(scale, phase, result)
@@ -0,0 +1,55 @@
+"""
+    Benchmark encoding of import chunks to json.
+
+    Compares utils.encode_to_json with the former jsonpickle encoding on 1500-record chunks,
+    and checks both produce the same payload.
+
+    $ python benchmarks/bench_json_encode.py --chunks 50
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import jsonpickle
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import utils
+from grid_objects import (Record, Cell)
+
+
+def generate_chunk(index, size):
+    chunk = []
+    for i in range(index * size, (index + 1) * size):
+        path = f"MMO/common/group{i % 100}"
+        chunk.append(Record(f"{path}/phrase{i}", path, [Cell('column1', f"Text of phrase {i} with ünïcödé")]))
+    return chunk
+
+
+def run(encode, chunks):
+    start = time.perf_counter()
+    payloads = [encode(chunk) for chunk in chunks]
+    return time.perf_counter() - start, payloads
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark encoding of import chunks to json')
+    parser.add_argument('--chunks', type=int, default=50, help='Number of chunks')
+    parser.add_argument('--chunk-size', type=int, default=1500, help='Records per chunk')
+    args = parser.parse_args()
+
+    chunks = [generate_chunk(index, args.chunk_size) for index in range(args.chunks)]
+
+    jsonpickle_time, expected = run(lambda chunk: jsonpickle.encode(chunk, unpicklable=False), chunks)
+    json_time, payloads = run(utils.encode_to_json, chunks)
+    assert payloads == expected, 'Payloads differ from jsonpickle'
+
+    print(f"{args.chunks} chunks of {args.chunk_size} records")
+    print(f"jsonpickle : {jsonpickle_time / args.chunks * 1000:8.2f} ms/chunk")
+    print(f"json       : {json_time / args.chunks * 1000:8.2f} ms/chunk")
+    if utils.orjson is not None:
+        orjson_time, _ = run(lambda chunk: utils.encode_to_json(chunk, 'orjson'), chunks)
+        print(f"orjson     : {orjson_time / args.chunks * 1000:8.2f} ms/chunk")
+    print(f"speedup    : {jsonpickle_time / json_time:8.1f}x")
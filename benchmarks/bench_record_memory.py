@@ -0,0 +1,67 @@
+"""
+    Benchmark memory held by the records of an import.
+
+    Compares the slotted Record/Cell of grid_objects with the former dict-backed classes,
+    on records shaped like the ones DefaultJsonImportStrategy extracts.
+
+    $ python benchmarks/bench_record_memory.py --records 1000000
+"""
+
+import argparse
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from grid_objects import (Record, Cell)
+
+
+#####
+# Former dict-backed classes
+#####
+class DictRecord:
+    def __init__(self, id, path, cells):
+        self.id = id
+        self.path = path
+        self.cells = cells
+
+
+class DictCell:
+    def __init__(self, id, value):
+        self.columnId = id
+        self.value = value
+
+
+def build(record_class, cell_class, count, groups):
+    records = []
+    for i in range(count):
+        # Paths and column ids are built per record, as the strategies do
+        path = f"/texts/group{i % groups}/sub{i % 7}"
+        column_id = ''.join(['column', '1'])
+        records.append(record_class(f"{path}/phrase{i}", path, [cell_class(column_id, f"Text of phrase {i}")]))
+    return records
+
+
+def measure(record_class, cell_class, count, groups):
+    tracemalloc.start()
+    records = build(record_class, cell_class, count, groups)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark memory held by the records of an import')
+    parser.add_argument('--records', type=int, default=1000000, help='Number of records')
+    parser.add_argument('--groups', type=int, default=1000, help='Number of distinct record groups')
+    args = parser.parse_args()
+
+    before = measure(DictRecord, DictCell, args.records, args.groups)
+    after = measure(Record, Cell, args.records, args.groups)
+
+    print(f"{args.records} records in {args.groups} groups")
+    print(f"dict-backed : {before / 1048576:8.1f} MB  {before / args.records:6.0f} bytes/record")
+    print(f"slotted     : {after / 1048576:8.1f} MB  {after / args.records:6.0f} bytes/record")
+    print(f"saved       : {(before - after) / before:8.1%}")
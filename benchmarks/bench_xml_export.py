@@ -0,0 +1,94 @@
+"""
+    Benchmark group lookup of the xml export strategy.
+
+    Compares the indexed DefaultXmlExportStrategy with the former linear XPath lookup
+    on a synthetic grid, built page by page the same way the export does.
+
+    $ python benchmarks/bench_xml_export.py --phrases 100000 --groups 500
+"""
+
+import argparse
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import strategy
+
+
+#####
+# Former strategy, scanning siblings with XPath for every level
+#####
+class LinearXmlExportStrategy(strategy.XmlExportStrategy):
+    def build(self, root: Dict, records: List):
+        for record in records:
+            group = root
+            levels = record['id'].split('/')
+
+            for level in levels[:-1]:
+                if level:
+                    found_group = group.find(f"./group[@name='{level}']")
+                    if found_group is None:
+                        group = ET.SubElement(group, 'group')
+                        group.attrib = {'name': level}
+                    else:
+                        group = found_group
+            if record['cells']:
+                phrase = ET.SubElement(group, 'phrase')
+                phrase.attrib = {'name': levels[-1], 'text': record['cells'][0].get('value', '')}
+
+        return root
+
+
+def generate_pages(phrases, groups, page_size):
+    """
+        Synthetic grid: phrases spread round-robin over `groups` wide groups of two levels
+    """
+    page = []
+    for i in range(phrases):
+        group = i % groups
+        page.append({
+            'id': f"MMO/group{group}/sub{i % 3}/phrase{i}",
+            'cells': [{'columnId': 'column1', 'value': f"Text of phrase {i}"}]
+        })
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def run(export_strategy, pages):
+    root = ET.Element("texts")
+    start = time.perf_counter()
+    for page in pages:
+        export_strategy.build(root, page)
+    return time.perf_counter() - start, root
+
+
+def count_phrases(root):
+    return sum(1 for _ in root.iter('phrase'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark group lookup of the xml export strategy')
+    parser.add_argument('--phrases', type=int, default=100000, help='Number of phrases in the grid')
+    parser.add_argument('--groups', type=int, default=500, help='Number of sibling groups at the first level')
+    parser.add_argument('--page-size', type=int, default=1500, help='Records per page')
+    args = parser.parse_args()
+
+    pages = list(generate_pages(args.phrases, args.groups, args.page_size))
+
+    indexed_time, indexed_root = run(strategy.DefaultXmlExportStrategy(), pages)
+    linear_time, linear_root = run(LinearXmlExportStrategy(), pages)
+
+    assert ET.tostring(indexed_root) == ET.tostring(linear_root), 'Strategies built different trees'
+
+    print(f"{args.phrases} phrases, {args.groups} groups, {count_phrases(indexed_root)} phrases built")
+    print(f"linear  : {linear_time:8.3f}s  {args.phrases / linear_time:12.0f} records/s")
+    print(f"indexed : {indexed_time:8.3f}s  {args.phrases / indexed_time:12.0f} records/s")
+    print(f"speedup : {linear_time / indexed_time:8.1f}x")
@@ -0,0 +1,232 @@
+"""
+    Local stand-in of the Gridly API for benchmarks.
+
+    Serves the records and files endpoints of any view from memory:
+    GET pages records with Link and X-Total-Count headers, POST/PATCH store records,
+    and POST files reads the uploaded body. Latency and HTTP 429 can be injected.
+
+    $ python benchmarks/mock_gridly.py --port 8765 --latency 0.05 --rate-429 0.01
+"""
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Stats:
+    """
+        Requests served by the mock.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0
+        self.records_in = 0
+        self.records_out = 0
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: value for name, value in vars(self).items() if name != 'lock'}
+
+
+class MockGridly:
+    """
+        Mock server running in a background thread.
+    """
+
+    def __init__(self, port=0, latency=0.0, rate_429=0.0, total_count=True, seed=0):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.total_count = total_count
+        self.random = random.Random(seed)
+        self.views = {}
+        self.views_lock = threading.Lock()
+        self.stats = Stats()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def records(self, view_id):
+        """ Records of the view by id, created on first use.
+        """
+        with self.views_lock:
+            return self.views.setdefault(view_id, {})
+
+    def store(self, view_id, records):
+        """ Create or update the records, cells are merged by column.
+        """
+        view = self.records(view_id)
+        with self.views_lock:
+            for record in records:
+                stored = view.setdefault(record['id'], {'id': record['id'], 'path': record.get('path'), 'cells': []})
+                cells = {cell['columnId']: cell for cell in stored['cells']}
+                for cell in record.get('cells', []):
+                    cells[cell['columnId']] = cell
+                stored['cells'] = list(cells.values())
+
+    def page(self, view_id, column_ids, limit, offset):
+        view = self.records(view_id)
+        with self.views_lock:
+            records = list(view.values())[offset:offset + limit]
+            total = len(view)
+        if column_ids:
+            records = [dict(record, cells=[cell for cell in record['cells'] if cell['columnId'] in column_ids])
+                       for record in records]
+        return records, total
+
+    def throttle(self):
+        """ Wait the latency, and tell whether the request is answered with HTTP 429.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self.stats.lock:
+            self.stats.requests += 1
+            throttled = self.random.random() < self.rate_429
+            if throttled:
+                self.stats.throttled += 1
+        return throttled
+
+
+def _handler(mock: MockGridly):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.__throttled():
+                return
+            url = urllib.parse.urlsplit(self.path)
+            view_id = self.__view_id(url.path, 'records')
+            if view_id is None:
+                return self.__send(404, {'message': 'Not found'})
+
+            query = urllib.parse.parse_qs(url.query)
+            page = json.loads(query.get('page', ['{}'])[0])
+            limit, offset = page.get('limit', 100), page.get('offset', 0)
+            column_ids = query['columnIds'][0].split(',') if 'columnIds' in query else None
+            records, total = mock.page(view_id, column_ids, limit, offset)
+
+            headers = {}
+            if mock.total_count:
+                headers['X-Total-Count'] = str(total)
+            if offset + limit < total:
+                query['page'] = [json.dumps({'limit': limit, 'offset': offset + limit})]
+                next_query = urllib.parse.urlencode({key: values[0] for key, values in query.items()})
+                headers['Link'] = f'<{mock.url}{url.path}?{next_query}>; rel="next"'
+
+            with mock.stats.lock:
+                mock.stats.records_out += len(records)
+            self.__send(200, records, headers)
+
+        def do_POST(self):
+            body = self.__read_body()
+            if self.__throttled():
+                return
+            url = urllib.parse.urlsplit(self.path)
+            if self.__view_id(url.path, 'files') is not None:
+                with mock.stats.lock:
+                    mock.stats.files += 1
+                return self.__send(201, {'size': len(body)})
+
+            view_id = self.__view_id(url.path, 'records')
+            if view_id is None:
+                return self.__send(404, {'message': 'Not found'})
+            records = json.loads(body)
+            mock.store(view_id, records)
+            with mock.stats.lock:
+                mock.stats.records_in += len(records)
+            self.__send(201, records)
+
+        def do_PATCH(self):
+            body = self.__read_body()
+            if self.__throttled():
+                return
+            view_id = self.__view_id(urllib.parse.urlsplit(self.path).path, 'records')
+            if view_id is None:
+                return self.__send(404, {'message': 'Not found'})
+            records = json.loads(body)
+            mock.store(view_id, records)
+            with mock.stats.lock:
+                mock.stats.records_in += len(records)
+            self.__send(200, records)
+
+        def __view_id(self, path, endpoint):
+            parts = path.strip('/').split('/')
+            if len(parts) == 4 and parts[0] == 'v1' and parts[1] == 'views' and parts[3] == endpoint:
+                return urllib.parse.unquote(parts[2])
+            return None
+
+        def __throttled(self):
+            if mock.throttle():
+                self.__send(429, {'message': 'Too many requests'}, {'Retry-After': '0'})
+                return True
+            return False
+
+        def __read_body(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            with mock.stats.lock:
+                mock.stats.bytes_in += len(body)
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            return body
+
+        def __send(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+            with mock.stats.lock:
+                mock.stats.bytes_out += len(data)
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in of the Gridly API')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Share of requests answered with HTTP 429')
+    parser.add_argument('--no-total-count', action='store_true', help='Page with Link headers only')
+    args = parser.parse_args()
+
+    mock = MockGridly(args.port, args.latency, args.rate_429, not args.no_total_count).start()
+    print(f'Mock Gridly API on {mock.url}, Ctrl+C to stop')
+    try:
+        mock.thread.join()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -1,45 +1,460 @@
+"""
+    Configurations of the script (config/script.yml) and of the data to sync (config/setup.yml).
+
+    Both files are parsed and validated once into immutable objects, and loaded again by reload()
+    when they were modified, for long running processes.
+"""
+
 import logging
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
 import utils
 
+SCRIPT_PATH = 'config/script.yml'
+SETUP_PATH = 'config/setup.yml'
+LOG_LEVELS = {'DEBUG': logging.DEBUG, 'WARNING': logging.WARNING}
+JSON_BACKENDS = ('json', 'orjson')
+IMPORT_EXTENSIONS = ('.xml', '.json', '.po')
+EXPORT_EXTENSIONS = ('.xml', '.json')
 
-script_configs = None
+logger = logging.getLogger(__name__)
 
 
-def __log_level():
-    config_level = script_configs['log']['level']
-    if config_level == 'DEBUG':
-        return logging.DEBUG
-    elif config_level == 'WARNING':
-        return logging.WARNING
-    else:
-        return logging.INFO
+class ConfigError(Exception):
+    """
+        Missing or invalid property in script.yml or setup.yml.
+    """
+
+
+@dataclass(frozen=True)
+class ScriptConfig:
+    gridly_url: str
+    max_fetch_retry: int = 3
+    export_max_workers: int = 1
+    prefetch_pages: int = 1
+    import_max_workers: int = 1
+    import_parse_workers: int = 1
+    upload_max_workers: int = 1
+    import_chunk_size: int = 1500
+    fetch_limit: int = 1500
+    chunk_auto_tune: bool = False
+    chunk_min_size: int = 100
+    chunk_max_size: int = 5000
+    chunk_max_payload_bytes: int = 4194304
+    http_pool_connections: int = 10
+    http_pool_maxsize: int = 10
+    http_compress_requests: bool = False
+    http_compress_min_size: int = 1024
+    http_accept_encoding: str = 'gzip, deflate'
+    rate_limit_per_second: float = 0
+    rate_limit_burst: int = 1
+    rate_limit_max_concurrency: int = 8
+    rate_limit_backoff: float = 0.5
+    rate_limit_max_backoff: float = 30
+    json_backend: str = 'json'
+    watch_interval: float = 1.0
+    watch_settle: float = 0.5
+    log_level: int = logging.INFO
+    log_mode: str = 'CONSOLE'
+
+
+@dataclass(frozen=True)
+class Grid:
+    name: str
+    view_id: str
+    default: bool = False
+    path: Optional[str] = None
+    page_size: Optional[int] = None
+    chunk_size: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class FileMapping:
+    file_name: str
+    column_id: str
+    lang: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class UploadMapping:
+    pattern: str
+    column_id: str
+    view_id: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ImportConfig:
+    data_directory: str
+    grids: Tuple[Grid, ...]
+    mappings: Tuple[FileMapping, ...]
+    cache: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ExportConfig:
+    directory: str
+    grids: Tuple[Grid, ...]
+    mappings: Tuple[FileMapping, ...]
+    combine: bool = True
+    cache: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class UploadConfig:
+    directory: str
+    view_id: str
+    mappings: Tuple[UploadMapping, ...]
+    cache: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class SetupConfig:
+    api_key: str
+    import_config: Optional[ImportConfig] = None
+    export_config: Optional[ExportConfig] = None
+    upload_config: Optional[UploadConfig] = None
+
+
+script_config: Optional[ScriptConfig] = None
+__script_mtime = None
+__setup = None
+__setup_mtime = None
 
 
 def init():
-    global script_configs
-    script_configs = utils.load_yml_file('config/script.yml')
-    log_mode = script_configs['log']['mode']
-    if log_mode == 'FILE':
+    global script_config, __script_mtime
+    script_config, __script_mtime = __load(SCRIPT_PATH, __parse_script)
+    if script_config.log_mode == 'FILE':
         logging.basicConfig(filename='log/app.log', filemode='w', format='%(asctime)s %(levelname)s: %(message)s', datefmt='%d-%b-%y %H:%M:%S',
-                        level=__log_level())
+                        level=script_config.log_level)
     else:
         logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
                             datefmt='%d-%b-%y %H:%M:%S',
-                            level=__log_level())
+                            level=script_config.log_level)
+
+
+def setup():
+    """ Get setup.yml, loaded and validated on first use.
+
+        :return: SetupConfig
+    """
+    global __setup, __setup_mtime
+    if __setup is None:
+        __setup, __setup_mtime = __load(SETUP_PATH, __parse_setup)
+    return __setup
+
+
+def reload():
+    """ Load script.yml and setup.yml again if they were modified since they were loaded.
+        The current configurations are kept when the new ones are invalid.
+
+        :return: True when a file was loaded again
+    """
+    global script_config, __script_mtime, __setup, __setup_mtime
+    reloaded = False
+    if __get_mtime(SCRIPT_PATH) != __script_mtime:
+        script_config, __script_mtime = __load(SCRIPT_PATH, __parse_script)
+        reloaded = True
+    if __setup is not None and __get_mtime(SETUP_PATH) != __setup_mtime:
+        __setup, __setup_mtime = __load(SETUP_PATH, __parse_setup)
+        reloaded = True
+    return reloaded
 
 
 def max_fetch_retry():
-    return int(script_configs['max-fetch-retry'])
+    return script_config.max_fetch_retry
+
+
+def export_max_workers():
+    return script_config.export_max_workers
+
+
+def prefetch_pages():
+    return script_config.prefetch_pages
+
+
+def import_max_workers():
+    return script_config.import_max_workers
+
+
+def import_parse_workers():
+    return script_config.import_parse_workers
+
+
+def upload_max_workers():
+    return script_config.upload_max_workers
 
 
 def import_chunk_size():
-    return 1500
+    return script_config.import_chunk_size
 
 
 def fetch_limit():
-    return 1500
+    return script_config.fetch_limit
+
+
+def chunk_auto_tune():
+    return script_config.chunk_auto_tune
+
+
+def chunk_min_size():
+    return script_config.chunk_min_size
+
+
+def chunk_max_size():
+    return script_config.chunk_max_size
+
+
+def chunk_max_payload_bytes():
+    return script_config.chunk_max_payload_bytes
+
+
+def http_pool_connections():
+    return script_config.http_pool_connections
+
+
+def http_pool_maxsize():
+    return script_config.http_pool_maxsize
+
+
+def http_compress_requests():
+    return script_config.http_compress_requests
+
+
+def http_compress_min_size():
+    return script_config.http_compress_min_size
+
+
+def http_accept_encoding():
+    return script_config.http_accept_encoding
+
+
+def rate_limit_per_second():
+    return script_config.rate_limit_per_second
+
+
+def rate_limit_burst():
+    return script_config.rate_limit_burst
+
+
+def rate_limit_max_concurrency():
+    return script_config.rate_limit_max_concurrency
+
+
+def rate_limit_backoff():
+    return script_config.rate_limit_backoff
+
+
+def rate_limit_max_backoff():
+    return script_config.rate_limit_max_backoff
+
+
+def json_backend():
+    return script_config.json_backend
+
+
+def watch_interval():
+    return script_config.watch_interval
+
+
+def watch_settle():
+    return script_config.watch_settle
 
 
 def gridly_url():
-    return script_configs['gridly-url']
+    return script_config.gridly_url
+
+
+#####
+# Load a configuration file
+#####
+def __get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def __load(path, parse):
+    mtime = __get_mtime(path)
+    if mtime is None:
+        raise ConfigError(f'{path} is missing.')
+    return parse(utils.load_yml_file(path)), mtime
+
+
+def __get_number(properties, keys, default, number_type=int, minimum=None):
+    name = '.'.join(keys)
+    value = utils.get_deep(properties, keys, default)
+    try:
+        value = number_type(value)
+    except (TypeError, ValueError):
+        raise ConfigError(f"{name} must be a number. Please fix '{name}' in script.yml")
+    if minimum is not None:
+        value = max(minimum, value)
+    return value
+
+
+#####
+# Validate properties in script.yml
+#####
+def __parse_script(properties):
+    if not isinstance(properties, dict) or 'gridly-url' not in properties:
+        raise ConfigError("gridly-url is missing. Please add 'gridly-url' property in script.yml.")
+
+    json_backend = properties.get('json-backend', 'json')
+    if json_backend not in JSON_BACKENDS:
+        raise ConfigError(f"json-backend must be one of {', '.join(JSON_BACKENDS)}. Please fix 'json-backend' in script.yml")
+    if json_backend == 'orjson' and utils.orjson is None:
+        logger.warning("orjson is not installed, json is used instead. Please install orjson or set 'json-backend: json' in script.yml")
+        json_backend = 'json'
+
+    chunk_min_size = __get_number(properties, ['chunk-auto-tune', 'min-size'], 100, minimum=1)
+    return ScriptConfig(
+        gridly_url=properties['gridly-url'],
+        max_fetch_retry=__get_number(properties, ['max-fetch-retry'], 3, minimum=0),
+        export_max_workers=__get_number(properties, ['export-max-workers'], 1, minimum=1),
+        prefetch_pages=__get_number(properties, ['prefetch-pages'], 1, minimum=1),
+        import_max_workers=__get_number(properties, ['import-max-workers'], 1, minimum=1),
+        import_parse_workers=__get_number(properties, ['import-parse-workers'], 1, minimum=1),
+        upload_max_workers=__get_number(properties, ['upload-max-workers'], 1, minimum=1),
+        import_chunk_size=__get_number(properties, ['import-chunk-size'], 1500, minimum=1),
+        fetch_limit=__get_number(properties, ['fetch-limit'], 1500, minimum=1),
+        chunk_auto_tune=bool(utils.get_deep(properties, ['chunk-auto-tune', 'enabled'], False)),
+        chunk_min_size=chunk_min_size,
+        chunk_max_size=__get_number(properties, ['chunk-auto-tune', 'max-size'], 5000, minimum=chunk_min_size),
+        chunk_max_payload_bytes=__get_number(properties, ['chunk-auto-tune', 'max-payload-bytes'], 4194304),
+        http_pool_connections=__get_number(properties, ['http', 'pool-connections'], 10),
+        http_pool_maxsize=__get_number(properties, ['http', 'pool-maxsize'], 10),
+        http_compress_requests=bool(utils.get_deep(properties, ['http', 'compress-requests'], False)),
+        http_compress_min_size=__get_number(properties, ['http', 'compress-min-size'], 1024),
+        http_accept_encoding=utils.get_deep(properties, ['http', 'accept-encoding'], 'gzip, deflate'),
+        rate_limit_per_second=__get_number(properties, ['rate-limit', 'requests-per-second'], 0, float),
+        rate_limit_burst=__get_number(properties, ['rate-limit', 'burst'], 1),
+        rate_limit_max_concurrency=__get_number(properties, ['rate-limit', 'max-concurrency'], 8),
+        rate_limit_backoff=__get_number(properties, ['rate-limit', 'backoff'], 0.5, float),
+        rate_limit_max_backoff=__get_number(properties, ['rate-limit', 'max-backoff'], 30, float),
+        json_backend=json_backend,
+        watch_interval=__get_number(properties, ['watch', 'interval'], 1.0, float, minimum=0.1),
+        watch_settle=__get_number(properties, ['watch', 'settle'], 0.5, float, minimum=0),
+        log_level=LOG_LEVELS.get(utils.get_deep(properties, ['log', 'level'], 'INFO'), logging.INFO),
+        log_mode=utils.get_deep(properties, ['log', 'mode'], 'CONSOLE'),
+    )
+
+
+#####
+# Validate properties in setup.yml
+#####
+def __require(properties, key, message):
+    if not isinstance(properties, dict) or key not in properties:
+        raise ConfigError(message)
+    return properties[key]
+
+
+def __parse_grids(properties, section, size_key):
+    grids = []
+    for grid in __require(properties, 'grids', f"{section} grid(s) is missing. Please add '{section}.grids' property in setup.yml."):
+        name = __require(grid, 'name', f"grid name is missing. Please add '{section}.grids.name' in setup.yml")
+        view_id = __require(grid, 'view-id', f"grid view-id is missing. Please add '{section}.grids.view-id' in setup.yml")
+        size = grid.get(size_key)
+        if size is not None and (not isinstance(size, int) or size < 1):
+            raise ConfigError(f"grid {size_key} must be a positive number. Please fix '{section}.grids.{size_key}' in setup.yml")
+
+        grids.append(Grid(
+            name=str(name),
+            view_id=str(view_id),
+            default=bool(grid.get('default', False)),
+            path=str(grid['path']) if 'path' in grid else None,
+            page_size=size if size_key == 'page-size' else None,
+            chunk_size=size if size_key == 'chunk-size' else None,
+        ))
+    return tuple(grids)
+
+
+def __parse_file_mappings(properties, section, extensions):
+    files = __require(properties, 'files', f"file(s) is missing. Please add '{section}.files' in setup.yml")
+    file_mappings = []
+    for file_mapping in __require(files, 'mappings', f"file mapping(s) is missing. Please add '{section}.files.mappings' in setup.yml"):
+        file_name = __require(file_mapping, 'file-name', f"file-name is missing. Please add '{section}.files.mappings.file-name' in setup.yml")
+        if not str(file_name).endswith(extensions):
+            raise ConfigError(f"file must be {'/'.join(extension[1:] for extension in extensions)} file. "
+                              f"Please fix '{section}.files.mappings.file-name' in setup.yml")
+        column_id = __require(file_mapping, 'column-id', f"column-id is missing. Please add '{section}.files.mappings.column-id' in setup.yml")
+
+        file_mappings.append(FileMapping(
+            file_name=str(file_name),
+            column_id=str(column_id),
+            lang=file_mapping.get('lang'),
+        ))
+    return tuple(file_mappings)
+
+
+def __parse_import(properties):
+    data_directory = __require(properties, 'data-directory', "import data-directory is missing. Please add 'import.data-directory' property in setup.yml.")
+    grids = __parse_grids(properties, 'import', 'chunk-size')
+    if not any(grid.default for grid in grids):
+        raise ConfigError("Default grid is missing. Please set one grid with 'import.grids.default=true' in setup.yml")
+
+    mappings = __parse_file_mappings(properties, 'import', IMPORT_EXTENSIONS)
+    __check_import_mappings(mappings)
+
+    return ImportConfig(
+        data_directory=data_directory,
+        grids=grids,
+        mappings=mappings,
+        cache=properties.get('cache'),
+    )
+
+
+def __check_import_mappings(mappings):
+    """
+        Reject the mappings which can never be used, as files are looked up by name in data-directory
+    """
+    seen = set()
+    for mapping in mappings:
+        if '/' in mapping.file_name:
+            raise ConfigError(f"file-name {mapping.file_name} must be a file of data-directory, without folder. "
+                              "Please fix 'import.files.mappings.file-name' in setup.yml")
+        if (mapping.file_name, mapping.column_id) in seen:
+            raise ConfigError(f"{mapping.file_name} is mapped twice to column {mapping.column_id}. "
+                              "Please remove one of them in 'import.files.mappings' in setup.yml")
+        seen.add((mapping.file_name, mapping.column_id))
+
+
+def __parse_export(properties):
+    return ExportConfig(
+        directory=__require(properties, 'directory', "export directory is missing. Please add 'export.directory' property in setup.yml."),
+        grids=__parse_grids(properties, 'export', 'page-size'),
+        mappings=__parse_file_mappings(properties, 'export', EXPORT_EXTENSIONS),
+        combine=bool(properties.get('combine', True)),
+        cache=properties.get('cache'),
+    )
+
+
+def __parse_upload(properties):
+    directory = __require(properties, 'directory', "upload directory is missing. Please add 'upload.directory' property in setup.yml.")
+    view_id = __require(properties, 'view-id', "upload view-id is missing. Please add 'upload.view-id' property in setup.yml.")
+    mappings = []
+    for file_mapping in __require(properties, 'mappings', "file mapping(s) is missing. Please add 'upload.mappings' in setup.yml"):
+        mappings.append(UploadMapping(
+            pattern=__require(file_mapping, 'pattern', "pattern is missing. Please add 'upload.mappings.pattern' in setup.yml"),
+            column_id=str(__require(file_mapping, 'column-id', "column-id is missing. Please add 'upload.mappings.column-id' in setup.yml")),
+            view_id=str(file_mapping['view-id']) if 'view-id' in file_mapping else None,
+        ))
+
+    return UploadConfig(
+        directory=directory,
+        view_id=str(view_id),
+        mappings=tuple(mappings),
+        cache=properties.get('cache'),
+    )
+
 
+def __parse_setup(properties):
+    api_key = __require(properties, 'api-key', "api-key is missing. Please add 'api-key' property in setup.yml.")
+    return SetupConfig(
+        api_key=str(api_key),
+        import_config=__parse_import(properties['import']) if 'import' in properties else None,
+        export_config=__parse_export(properties['export']) if 'export' in properties else None,
+        upload_config=__parse_upload(properties['upload']) if 'upload' in properties else None,
+    )
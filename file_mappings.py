@@ -0,0 +1,62 @@
+"""
+    Lookup of the file mappings of setup.yml.
+"""
+
+import fnmatch
+import re
+from typing import List, Sequence
+
+GLOB_CHARS = re.compile(r'[*?\[]')
+EXTENSION_GLOB = re.compile(r'^\*(\.[^*?\[/]+)$')
+
+
+class FileMappings:
+    """
+        File mappings indexed by file name, by extension ('*.po') and by glob pattern ('strings.*.xml').
+
+        A file gets the mappings of its exact name, of its extensions and of the patterns it matches,
+        in configuration order. A file can be mapped to several columns by several mappings, and to a
+        column once: the first mapping of the column is used.
+    """
+
+    def __init__(self, mappings: Sequence, key='file_name'):
+        # (order, mapping) by file name, by extension and by pattern
+        self.by_name = {}
+        self.by_extension = {}
+        self.patterns = []
+
+        for order, mapping in enumerate(mappings):
+            name = getattr(mapping, key)
+            extension = EXTENSION_GLOB.match(name)
+            if extension:
+                self.by_extension.setdefault(extension.group(1), []).append((order, mapping))
+            elif GLOB_CHARS.search(name):
+                self.patterns.append((re.compile(fnmatch.translate(name)), (order, mapping)))
+            else:
+                self.by_name.setdefault(name, []).append((order, mapping))
+
+    def get(self, file_name) -> List:
+        """ Get the mappings of the file.
+
+            :return: List of mappings, empty when the file is not mapped
+        """
+        matches = list(self.by_name.get(file_name, ()))
+
+        if self.by_extension:
+            # 'strings.cs.xml' is looked up as '.cs.xml' and '.xml'
+            position = file_name.find('.')
+            while position >= 0:
+                matches.extend(self.by_extension.get(file_name[position:], ()))
+                position = file_name.find('.', position + 1)
+
+        matches.extend(match for pattern, match in self.patterns if pattern.match(file_name))
+        if len(matches) == 1:
+            return [matches[0][1]]
+
+        mappings = []
+        column_ids = set()
+        for _, mapping in sorted(matches, key=lambda match: match[0]):
+            if mapping.column_id not in column_ids:
+                column_ids.add(mapping.column_id)
+                mappings.append(mapping)
+        return mappings
@@ -1,13 +1,25 @@
+import sys
+
+
 class Record:
     """
-        Record in grid.
+        Record in grid. Slotted and with an interned path, as imports hold millions of them.
     """
+    __slots__ = ('id', 'path', 'cells')
 
     def __init__(self, id, path, cells):
         self.id = id
-        self.path = path
+        self.path = sys.intern(path)
         self.cells = cells
 
+    def __getstate__(self):
+        return {'id': self.id, 'path': self.path, 'cells': self.cells}
+
+    def __setstate__(self, state):
+        self.id = state['id']
+        self.path = sys.intern(state['path'])
+        self.cells = state['cells']
+
     def __str__(self):
         return self.id
 
@@ -16,11 +28,19 @@ class Cell:
     """
         Cell in record.
     """
+    __slots__ = ('columnId', 'value')
 
     def __init__(self, id, value):
-        self.columnId = id
+        self.columnId = sys.intern(id)
         self.value = value
 
+    def __getstate__(self):
+        return {'columnId': self.columnId, 'value': self.value}
+
+    def __setstate__(self, state):
+        self.columnId = sys.intern(state['columnId'])
+        self.value = state['value']
+
     def __str__(self):
         return self.columnId
 
@@ -34,6 +54,9 @@ class Page:
         self.limit = limit
         self.offset = offset
 
+    def __getstate__(self):
+        return {'limit': self.limit, 'offset': self.offset}
+
     def __str__(self):
         return f'limit: {self.limit} - offset: {self.offset}'
 
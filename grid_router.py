@@ -0,0 +1,94 @@
+"""
+    Routing of imported records to their grid.
+"""
+
+from collections import deque
+from typing import Sequence
+
+from configs import Grid
+
+
+class GridRouter:
+    """
+        Grid of a record id, by the 'path' of the import grids, matched anywhere in the id.
+
+        The record goes to the grid with the longest path found in its id, to the first configured one
+        when several paths are as long, and to the default grid when no path is found.
+        The paths are compiled once into an Aho-Corasick automaton, so an id is routed in one pass
+        whatever the number of grids.
+    """
+
+    def __init__(self, grids: Sequence[Grid]):
+        self.grids = grids
+        self.default_grid = None
+        # Transitions, failure link and best (-length, order) match of every state
+        self.__goto = [{}]
+        self.__fail = [0]
+        self.__match = [None]
+
+        for order, grid in enumerate(grids):
+            if grid.default:
+                self.default_grid = grid
+            elif grid.path is not None:
+                self.__add(grid.path, order)
+        self.__link()
+
+    def route(self, record_id):
+        """ Get the grid to import the record to.
+
+            :return: Grid
+        """
+        goto = self.__goto
+        fail = self.__fail
+        match = self.__match
+
+        # Only a default grid
+        if not goto[0] and match[0] is None:
+            return self.default_grid
+
+        state = 0
+        best = match[0]
+        for char in record_id:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if match[state] is not None and (best is None or match[state] < best):
+                best = match[state]
+
+        if best is None:
+            return self.default_grid
+        return self.grids[best[1]]
+
+    def __add(self, path, order):
+        state = 0
+        for char in path:
+            next_state = self.__goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.__goto)
+                self.__goto[state][char] = next_state
+                self.__goto.append({})
+                self.__fail.append(0)
+                self.__match.append(None)
+            state = next_state
+
+        # The same path configured twice goes to its first grid
+        if self.__match[state] is None:
+            self.__match[state] = (-len(path), order)
+
+    def __link(self):
+        """ Set the failure links breadth first, each state also matching the paths ending its own.
+        """
+        queue = deque(self.__goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.__goto[state].items():
+                fail = self.__fail[state]
+                while fail and char not in self.__goto[fail]:
+                    fail = self.__fail[fail]
+                fail = self.__goto[fail].get(char, 0)
+                self.__fail[next_state] = fail
+
+                inherited = self.__match[fail]
+                if inherited is not None and (self.__match[next_state] is None or inherited < self.__match[next_state]):
+                    self.__match[next_state] = inherited
+                queue.append(next_state)
@@ -0,0 +1,280 @@
+"""
+    Incremental JSON reader, so huge documents are read without loading them in memory.
+"""
+
+import codecs
+import json
+import re
+from json.decoder import scanstring
+from json.scanner import NUMBER_RE
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_CHARS = re.compile(r'[-+.eE0-9]*')
+CONSTANTS = {
+    'true': True,
+    'false': False,
+    'null': None,
+    'NaN': float('nan'),
+    'Infinity': float('inf'),
+    '-Infinity': float('-inf'),
+}
+
+DECODER = json.JSONDecoder()
+
+# States of the reader
+VALUE = 0
+FIRST_KEY = 1
+FIRST_ITEM = 2
+AFTER_VALUE = 3
+
+
+class JsonScanner:
+    """
+        Read JSON tokens from a text file, chunk by chunk.
+    """
+
+    def __init__(self, text_file, chunk_size=65536):
+        self.text_file = text_file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """ Read the next chunk, dropping what is already consumed.
+
+            :return: False at the end of the file
+        """
+        if self.eof:
+            return False
+        chunk = self.text_file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """ Skip whitespaces and get the next character without consuming it.
+
+            :return: the character, or None at the end of the file
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            self.error(f"Expecting '{char}'")
+        self.pos += 1
+
+    def string(self):
+        """ Read a string, the current character is the opening quote.
+        """
+        while True:
+            try:
+                value, self.pos = scanstring(self.buffer, self.pos + 1)
+                return value
+            except json.JSONDecodeError:
+                # The string may continue in the next chunk
+                if not self.fill():
+                    raise
+
+    def scalar(self):
+        """ Read a number or a constant at the current position.
+        """
+        while True:
+            # The number may continue in the next chunk
+            if NUMBER_CHARS.match(self.buffer, self.pos).end() == len(self.buffer) and self.fill():
+                continue
+
+            match = NUMBER_RE.match(self.buffer, self.pos)
+            if match:
+                integer, fraction, exponent = match.groups()
+                self.pos = match.end()
+                if fraction or exponent:
+                    return float(integer + (fraction or '') + (exponent or ''))
+                return int(integer)
+
+            for name, value in CONSTANTS.items():
+                if self.buffer.startswith(name, self.pos):
+                    self.pos += len(name)
+                    return value
+
+            # The constant may be cut at the end of the chunk
+            if len(self.buffer) - self.pos < len('-Infinity') and self.fill():
+                continue
+            self.error('Expecting value')
+
+    def value(self):
+        """ Read a whole value at the current position.
+        """
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+                # A number may continue in the next chunk
+                if self.eof or NUMBER_CHARS.match(self.buffer, end).end() < len(self.buffer):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def error(self, message):
+        raise json.JSONDecodeError(message, self.buffer, self.pos)
+
+
+class TextChunks:
+    """
+        Text file over chunks of bytes, decoded as they come, e.g. Response.iter_content().
+    """
+
+    def __init__(self, byte_chunks, encoding='utf-8'):
+        self.byte_chunks = iter(byte_chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+
+    def read(self, size=-1):
+        """ Decode the next chunk, whatever the size.
+
+            :return: the text, empty at the end
+        """
+        for chunk in self.byte_chunks:
+            text = self.decoder.decode(chunk)
+            # A chunk may hold only part of a character
+            if text:
+                return text
+        return self.decoder.decode(b'', final=True)
+
+
+def iter_array_items(text_file, chunk_size=65536):
+    """
+        Yield the items of the JSON array as they are read.
+    """
+    scanner = JsonScanner(text_file, chunk_size)
+    scanner.expect('[')
+    if scanner.peek() == ']':
+        scanner.pos += 1
+    else:
+        while True:
+            if scanner.peek() is None:
+                scanner.error('Expecting value')
+            yield scanner.value()
+            char = scanner.peek()
+            if char == ']':
+                scanner.pos += 1
+                break
+            if char != ',':
+                scanner.error("Expecting ',' delimiter")
+            scanner.pos += 1
+
+    if scanner.peek() is not None:
+        scanner.error('Extra data')
+
+
+def iter_leaves(text_file, chunk_size=65536, repeated=None):
+    """
+        Yield (path, value) of every scalar in the JSON document as it is read, path as '/a/b/0'.
+        Empty objects and arrays have no leaves. A key repeated in an object is yielded again,
+        unless a repeated dict is given: its leaves are put there instead, with their last value.
+
+        >>> import io
+        >>> repeated = {}
+        >>> list(iter_leaves(io.StringIO('{"a": 1, "b": 2, "a": 3, "a": 4}'), repeated=repeated)), repeated
+        ([('/a', 1), ('/b', 2)], {'/a': 4})
+
+        The leaves of a root object are not held until its end:
+
+        >>> import itertools
+        >>> chunks = itertools.chain(['{'], (f'"k{i}": {i}, ' for i in itertools.count()))
+        >>> endless = type('Endless', (), {'read': lambda self, size=-1: next(chunks)})()
+        >>> next(iter_leaves(endless))
+        ('/k0', 0)
+    """
+    scanner = JsonScanner(text_file, chunk_size)
+    # [is_object, path, index, keys, in a repeated key] of the open objects and arrays
+    opened = []
+    # Number of open objects whose current key is repeated
+    repeating = 0
+    path = ''
+    state = VALUE
+
+    while True:
+        char = scanner.peek()
+
+        if state == VALUE:
+            if char == '{':
+                scanner.pos += 1
+                opened.append([True, path, 0, set(), False])
+                state = FIRST_KEY
+            elif char == '[':
+                scanner.pos += 1
+                opened.append([False, path, 0, None, False])
+                state = FIRST_ITEM
+            elif char is None:
+                scanner.error('Expecting value')
+            else:
+                value = scanner.string() if char == '"' else scanner.scalar()
+                if repeating and repeated is not None:
+                    repeated[path] = value
+                else:
+                    yield path, value
+                state = AFTER_VALUE
+
+        elif state == FIRST_KEY:
+            if char == '}':
+                scanner.pos += 1
+                path = opened.pop()[1]
+                state = AFTER_VALUE
+            else:
+                key, path = __read_key(scanner, opened[-1][1])
+                opened[-1][3].add(key)
+                state = VALUE
+
+        elif state == FIRST_ITEM:
+            if char == ']':
+                scanner.pos += 1
+                path = opened.pop()[1]
+                state = AFTER_VALUE
+            else:
+                path = f"{opened[-1][1]}/0"
+                state = VALUE
+
+        else:
+            if not opened:
+                if char is not None:
+                    scanner.error('Extra data')
+                return
+
+            container = opened[-1]
+            if char == ',':
+                scanner.pos += 1
+                if container[0]:
+                    key, path = __read_key(scanner, container[1])
+                    is_repeated = key in container[3]
+                    if is_repeated != container[4]:
+                        container[4] = is_repeated
+                        repeating += 1 if is_repeated else -1
+                    container[3].add(key)
+                else:
+                    container[2] += 1
+                    path = f"{container[1]}/{container[2]}"
+                state = VALUE
+            elif char == ('}' if container[0] else ']'):
+                scanner.pos += 1
+                if opened.pop()[4]:
+                    repeating -= 1
+            else:
+                scanner.error("Expecting ',' delimiter")
+
+
+def __read_key(scanner: JsonScanner, parent_path):
+    if scanner.peek() != '"':
+        scanner.error('Expecting property name enclosed in double quotes')
+    key = scanner.string()
+    scanner.expect(':')
+    return key, f"{parent_path}/{key}"
@@ -2,28 +2,47 @@
     Main module.
 """
 import argparse
+import logging
+import sys
 import configs
+import api
 import _export
 import _import
+import _upload
+import _watch
 
 IMPORT_DATA_OPT = 'import'
 EXPORT_OPT = 'export'
+UPLOAD_OPT = 'upload'
+WATCH_OPT = 'watch'
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Script to work with Gridly via XML/JSON file')
 
-    parser.add_argument('-o', '--option', choices=['import', 'export'], action='store', required=True,
-                        help="Please select either 'import' or 'export'")
+    parser.add_argument('-o', '--option', choices=['import', 'export', 'upload', 'watch'], action='store', required=True,
+                        help="Please select either 'import', 'export', 'upload' or 'watch'")
 
     args = parser.parse_args()
     action = args.option
 
-    # Load config before running scripts
-    configs.init()
+    try:
+        # Load and validate config before running scripts
+        configs.init()
+        setup = configs.setup()
 
-    if action == IMPORT_DATA_OPT:
-        _import.import_data()
-    elif action == EXPORT_OPT:
-        _export.export()
-    else:
-        print('Should not go here ^.^')
+        if action == IMPORT_DATA_OPT:
+            _import.import_data(setup)
+        elif action == EXPORT_OPT:
+            _export.export(setup)
+        elif action == UPLOAD_OPT:
+            _upload.upload_files(setup)
+        elif action == WATCH_OPT:
+            _watch.watch(setup)
+        else:
+            print('Should not go here ^.^')
+    except configs.ConfigError as error:
+        logging.error(error)
+        sys.exit(1)
+    finally:
+        # Release the pooled connections shared by import/export
+        api.close()
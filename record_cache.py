@@ -0,0 +1,179 @@
+"""
+    Local cache of record hashes, to find what changed since the last run.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+import utils
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS export_records (
+        view_id TEXT NOT NULL,
+        column_id TEXT NOT NULL,
+        record_id TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        PRIMARY KEY (view_id, column_id, record_id)
+    );
+    CREATE TABLE IF NOT EXISTS export_files (
+        path TEXT PRIMARY KEY,
+        signature TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS import_records (
+        file_name TEXT NOT NULL,
+        column_id TEXT NOT NULL,
+        record_id TEXT NOT NULL,
+        view_id TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        PRIMARY KEY (file_name, column_id, record_id)
+    );
+    CREATE TABLE IF NOT EXISTS uploaded_files (
+        view_id TEXT NOT NULL,
+        record_id TEXT NOT NULL,
+        column_id TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        PRIMARY KEY (view_id, record_id, column_id)
+    );
+'''
+
+
+def hash_value(value):
+    """
+        Content hash of a json serializable value
+    """
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class RecordCache:
+    """
+        SQLite store of the records of the last run, keyed by view-id/column-id/record-id.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            utils.create_dir_if_not_exists(directory)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.__lock = threading.Lock()
+
+    def get_export_records(self, view_id, column_id):
+        """ Hashes of the exported records of the column.
+
+            :return: Dict record-id -> hash
+        """
+        with self.__lock:
+            rows = self.connection.execute(
+                'SELECT record_id, hash FROM export_records WHERE view_id = ? AND column_id = ?',
+                (view_id, column_id))
+            return dict(rows)
+
+    def save_export_records(self, view_id, column_id, hashes: Dict):
+        with self.__lock, self.connection:
+            self.connection.execute('DELETE FROM export_records WHERE view_id = ? AND column_id = ?',
+                                    (view_id, column_id))
+            self.connection.executemany(
+                'INSERT INTO export_records (view_id, column_id, record_id, hash) VALUES (?, ?, ?, ?)',
+                ((view_id, column_id, record_id, record_hash) for record_id, record_hash in hashes.items()))
+
+    def get_file_signature(self, path):
+        with self.__lock:
+            row = self.connection.execute('SELECT signature FROM export_files WHERE path = ?', (path,)).fetchone()
+            return row[0] if row else None
+
+    def save_file_signature(self, path, signature):
+        with self.__lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO export_files (path, signature) VALUES (?, ?)',
+                                    (path, signature))
+
+    def get_import_records(self, file_name, column_id):
+        """ View id and hash of the records imported from the file to the column.
+
+            :return: Dict record-id -> (view-id, hash)
+        """
+        with self.__lock:
+            rows = self.connection.execute(
+                'SELECT record_id, view_id, hash FROM import_records WHERE file_name = ? AND column_id = ?',
+                (file_name, column_id))
+            return {record_id: (view_id, record_hash) for record_id, view_id, record_hash in rows}
+
+    def save_import_records(self, file_name, column_id, view_id, hashes: Dict):
+        with self.__lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO import_records (file_name, column_id, record_id, view_id, hash) '
+                'VALUES (?, ?, ?, ?, ?)',
+                ((file_name, column_id, record_id, view_id, record_hash) for record_id, record_hash in hashes.items()))
+
+    def delete_import_records(self, file_name, column_id, record_ids):
+        with self.__lock, self.connection:
+            self.connection.executemany(
+                'DELETE FROM import_records WHERE file_name = ? AND column_id = ? AND record_id = ?',
+                ((file_name, column_id, record_id) for record_id in record_ids))
+
+    def get_uploaded_file_hash(self, view_id, record_id, column_id):
+        with self.__lock:
+            row = self.connection.execute(
+                'SELECT hash FROM uploaded_files WHERE view_id = ? AND record_id = ? AND column_id = ?',
+                (view_id, record_id, column_id)).fetchone()
+            return row[0] if row else None
+
+    def save_uploaded_file_hash(self, view_id, record_id, column_id, file_hash):
+        with self.__lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO uploaded_files (view_id, record_id, column_id, hash) VALUES (?, ?, ?, ?)',
+                (view_id, record_id, column_id, file_hash))
+
+    def close(self):
+        self.connection.close()
+
+
+class ImportState:
+    """
+        Records of a file and column at their last successful import.
+    """
+    NEW = 'new'
+    CHANGED = 'changed'
+
+    def __init__(self, cache: RecordCache, file_name, column_id):
+        self.cache = cache
+        self.file_name = file_name
+        self.column_id = column_id
+        self.previous = cache.get_import_records(file_name, column_id)
+        self.seen = set()
+
+    @staticmethod
+    def hash_record(record):
+        return hash_value([record.path, [[cell.columnId, cell.value] for cell in record.cells]])
+
+    def get_change(self, view_id, record):
+        """ Compare the record with its last import.
+
+            :return: NEW, CHANGED or None when it is the same
+        """
+        self.seen.add(record.id)
+        previous = self.previous.get(record.id)
+        if previous is None or previous[0] != view_id:
+            return ImportState.NEW
+        if previous[1] != self.hash_record(record):
+            return ImportState.CHANGED
+        return None
+
+    def save(self, view_id, records):
+        """ Remember the records once they are uploaded.
+        """
+        hashes = {record.id: self.hash_record(record) for record in records}
+        self.cache.save_import_records(self.file_name, self.column_id, view_id, hashes)
+
+    def forget_removed(self):
+        """ Forget the records which are no longer in the file.
+
+            :return: List of the removed record ids
+        """
+        removed = [record_id for record_id in self.previous if record_id not in self.seen]
+        self.cache.delete_import_records(self.file_name, self.column_id, removed)
+        return removed
@@ -3,10 +3,13 @@
 """
 
 import logging
+import threading
+import weakref
 import xml.etree.ElementTree as ET
 from abc import ABC, abstractmethod
 from typing import List
 from typing import Dict
+from typing import Iterable
 from grid_objects import (Record, Cell)
 import utils
 
@@ -31,17 +34,26 @@ class DefaultXmlExportStrategy(XmlExportStrategy):
     """
             DefaultXmlExportStrategy. This is served a specific case
     """
+    def __init__(self):
+        # Group elements of each root keyed by their joined path, e.g. '/MMO/common'
+        self.__group_indexes = weakref.WeakKeyDictionary()
+        self.__lock = threading.Lock()
+
     def build(self, root: Dict, records: List):
+        group_index = self.__get_group_index(root)
         for record in records:
             group = root
+            prefix = ''
             levels = record['id'].split('/')
 
             for level in levels[:-1]:
                 if level:
-                    found_group = group.find(f"./group[@name='{level}']")
-                    if not found_group:
+                    prefix = f"{prefix}/{level}"
+                    found_group = group_index.get(prefix)
+                    if found_group is None:
                         group = ET.SubElement(group, 'group')
                         group.attrib = {'name': level}
+                        group_index[prefix] = group
                     else:
                         group = found_group
             if record['cells']:
@@ -50,6 +62,31 @@ class DefaultXmlExportStrategy(XmlExportStrategy):
                     phrase.attrib = {'name': levels[-1], 'text': record['cells'][0].get('value', '')}
 
         return root
+
+    def __get_group_index(self, root):
+        with self.__lock:
+            group_index = self.__group_indexes.get(root)
+            if group_index is None:
+                group_index = self.__index_groups(root)
+                self.__group_indexes[root] = group_index
+            return group_index
+
+    @staticmethod
+    def __index_groups(root):
+        """
+            Index the groups already in the root, the first group of a name wins
+        """
+        group_index = {}
+        nodes = [(root, '')]
+        while nodes:
+            node, prefix = nodes.pop()
+            for group in node.iterfind('group'):
+                key = f"{prefix}/{group.get('name')}"
+                if key not in group_index:
+                    group_index[key] = group
+                    nodes.append((group, key))
+        return group_index
+
 #####
 # Base class for export json file
 #####
@@ -103,6 +140,18 @@ class XmlImportStrategy(ABC):
         self.extract(keys, records, column_id, tree, previous_path)
         return records
 
+    def stream(self, column_id, events: Iterable):
+        """
+            Yield records from iterparse (start, end) events.
+            By default the whole tree is built first, then read.
+        """
+        root = None
+        for event, element in events:
+            if root is None:
+                root = element
+        if root is not None:
+            yield from self.read(column_id, root)
+
     @abstractmethod
     def extract(self, keys, records, column_id, tree: Dict, previous_path=''):
         pass
@@ -130,6 +179,43 @@ class DefaultXmlImportStrategy(XmlImportStrategy):
                     logger.warning(f"Tag {child.tag} in path {previous_path} does not have 'name' attribute.")
                 logger.info(tree)
 
+    def stream(self, column_id, events: Iterable):
+        """
+            Yield each phrase as soon as it is closed, then drop it from the tree
+        """
+        keys = {}
+        # [element, path, has_child] of the open elements, path is None inside a skipped element
+        opened = []
+        for event, element in events:
+            if event == 'start':
+                if not opened:
+                    opened.append([element, '', False])
+                    continue
+
+                parent = opened[-1]
+                parent[2] = True
+                if parent[1] is None:
+                    opened.append([element, None, False])
+                elif 'name' in element.attrib:
+                    opened.append([element, parent[1] + "/" + element.attrib['name'], False])
+                else:
+                    logger.warning(f"Tag {element.tag} in path {parent[1]} does not have 'name' attribute.")
+                    opened.append([element, None, False])
+            else:
+                element, path, has_child = opened.pop()
+                if not opened:
+                    break
+
+                if path is not None and not has_child:
+                    if 'text' in element.attrib and element.tag == 'phrase':
+                        key = utils.get_next_key(keys, utils.get_string_after(path, '/'))
+                        yield Record(key, '', [Cell(column_id, element.attrib['text'])])
+                    else:
+                        logger.warning(f"Tag {element.tag} in path {path} is not 'phrase' tag.")
+
+                # Children are done with, keep the memory flat
+                del opened[-1][0][:]
+
 #####
 # Base class for import po file
 #####
@@ -179,6 +265,13 @@ class JsonImportStrategy(ABC):
         records = []
         self.extract(records, column_id, json_obj, previous_path)
         return records
+
+    def stream(self, column_id, leaves: Iterable):
+        """
+            Yield a record for each (path, value) leaf of the json file
+        """
+        for path, value in leaves:
+            yield Record(path, path[0:path.rfind("/")], [Cell(column_id, value)])
         
     @abstractmethod
     def extract(self, records, column_id, json_obj: Dict, previous_path=''):
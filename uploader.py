@@ -0,0 +1,137 @@
+"""
+    Uploader module to post chunks of records concurrently.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class UploadReport:
+    """
+        Aggregated result of the posted chunks.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+        self.records = 0
+        self.failed_chunks = 0
+        self.failed_records = 0
+        self.__lock = threading.Lock()
+
+    def add(self, records_count, succeeded):
+        with self.__lock:
+            self.chunks += 1
+            self.records += records_count
+            if not succeeded:
+                self.failed_chunks += 1
+                self.failed_records += records_count
+
+    def __str__(self):
+        return (f'{self.records - self.failed_records}/{self.records} record(s) imported in {self.chunks} chunk(s), '
+                f'{self.failed_chunks} chunk(s) failed')
+
+
+class ChunkSizeTuner:
+    """
+        Chunk size of a grid, adjusted to the throughput of its requests.
+
+        The size keeps moving by a quarter in the same direction while the records per second improve,
+        and turns back when they drop. A failed chunk halves the size, and the size never grows past
+        max_payload_bytes for the bytes per record seen so far.
+    """
+
+    def __init__(self, size, min_size=100, max_size=5000, max_payload_bytes=4194304):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_payload_bytes = max_payload_bytes
+        self.size = min(max(size, min_size), max_size)
+        self.__throughput = 0
+        self.__direction = 1
+        self.__lock = threading.Lock()
+
+    def add(self, records_count, seconds, payload_bytes, succeeded):
+        """ Adjust the size to a posted chunk.
+        """
+        with self.__lock:
+            if not succeeded:
+                self.size = max(self.min_size, self.size // 2)
+                self.__throughput = 0
+                self.__direction = 1
+                return
+
+            # The last chunk of a file or grid is smaller and says little about the size
+            if records_count < self.size // 2:
+                return
+
+            throughput = records_count / max(seconds, 1e-6)
+            if throughput < self.__throughput:
+                self.__direction = -self.__direction
+            self.__throughput = throughput
+
+            size = self.size + self.__direction * max(1, self.size // 4)
+            if payload_bytes:
+                size = min(size, int(self.max_payload_bytes * records_count / payload_bytes))
+            self.size = min(max(size, self.min_size), self.max_size)
+
+
+class ChunkUploader:
+    """
+        Post chunks with a pool of workers, fed through a bounded queue.
+
+        post(grid, records, *args) returns True when the chunk is uploaded. An exception raised by post
+        stops the uploader and is raised again to the caller on the next submit or on close.
+    """
+
+    def __init__(self, post, max_workers=1, max_pending=None):
+        self.post = post
+        self.report = UploadReport()
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__max_pending = max_pending or max_workers * 2
+        self.__slots = threading.BoundedSemaphore(self.__max_pending)
+        self.__error = None
+
+    def submit(self, grid, records, *args):
+        """ Queue the chunk, waiting while the queue is full.
+        """
+        self.__slots.acquire()
+        self.__raise_error()
+        self.__executor.submit(self.__upload, grid, records, *args)
+
+    def wait(self):
+        """ Wait for the queued chunks to be posted, the uploader can still be used afterwards.
+        """
+        for _ in range(self.__max_pending):
+            self.__slots.acquire()
+        for _ in range(self.__max_pending):
+            self.__slots.release()
+        self.__raise_error()
+
+    def close(self):
+        """ Wait for the queued chunks to be posted.
+
+            :return: UploadReport
+        """
+        self.__executor.shutdown(wait=True)
+        self.__raise_error()
+        return self.report
+
+    def __upload(self, grid, records, *args):
+        succeeded = False
+        try:
+            if self.__error is None:
+                succeeded = self.post(grid, records, *args)
+        except BaseException as error:
+            self.__error = error
+        finally:
+            self.report.add(len(records), succeeded)
+            self.__slots.release()
+
+    def __raise_error(self):
+        if self.__error is not None:
+            error = self.__error
+            self.__error = None
+            self.__executor.shutdown(wait=True)
+            raise error
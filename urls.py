@@ -2,12 +2,12 @@
 This module is for getting request urls.
 """
 
-import jsonpickle
 from requests.utils import requote_uri
 from typing import List
 from typing import Dict
 import urllib.parse
 import configs
+import utils
 
 
 def quote(url):
@@ -36,7 +36,7 @@ def get_record_url(view_id, column_ids: List, page: Dict):
         queries.append('columnIds=' + ','.join(column_ids))
 
     if page:
-        queries.append('page=' + jsonpickle.encode(page, unpicklable=False))
+        queries.append('page=' + utils.encode_to_json(page))
 
     if queries:
         url = url + '?' + '&'.join(queries)
@@ -4,13 +4,19 @@
 import logging
 from pathlib import Path
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import os
+import hashlib
+import mimetypes
 import filetype 
 import json
 import jsonpickle
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import yaml
 import polib
+import json_stream
 from typing import Dict
 
 logger = logging.getLogger(__name__)
@@ -25,6 +31,16 @@ def load_json_file(file_path):
     with open(file_path, "r", encoding="utf8") as json_file:
         return json.load(json_file)
 
+#####
+# Read the json file leaf by leaf
+#####
+def iter_json_file(file_path, repeated=None):
+    """
+        iterate (path, value) of json file as it is read, the leaves of repeated keys go to repeated when given
+    """
+    with open(file_path, "r", encoding="utf8") as json_file:
+        yield from json_stream.iter_leaves(json_file, repeated=repeated)
+
 #####
 # Read the yaml file
 #####
@@ -45,6 +61,15 @@ def load_xml_file(file_path):
     tree = ET.parse(file_path)
     return tree.getroot()
 
+#####
+# Read the xml file element by element
+#####
+def iter_xml_file(file_path):
+    """
+        iterate (event, element) of xml file as it is parsed
+    """
+    return ET.iterparse(file_path, events=('start', 'end'))
+
 #####
 # Read the po file 
 #####
@@ -70,11 +95,43 @@ def dump_to_json_file(file_path, obj: Dict):
 #####
 def dump_to_xml_file(file_path, root: Dict):
     """
-        write object as xml to file
+        write object as xml to file, indented the same way as minidom toprettyxml
     """
-    reparsed = minidom.parseString(ET.tostring(root, 'utf-8'))
     with open(file_path, "w", encoding="utf8") as text_file:
-        text_file.write(reparsed.toprettyxml(indent="  "))
+        text_file.write('<?xml version="1.0" ?>\n')
+        __write_xml_element(text_file.write, root, '')
+
+
+def __escape_xml(data):
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def __write_xml_element(write, element, indent):
+    write(f'{indent}<{element.tag}')
+    for name, value in element.attrib.items():
+        write(f' {name}="{__escape_xml(value)}"')
+
+    nodes = []
+    if element.text:
+        nodes.append(element.text)
+    for child in element:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+
+    if not nodes:
+        write('/>\n')
+    elif len(nodes) == 1 and isinstance(nodes[0], str):
+        write(f'>{__escape_xml(nodes[0])}</{element.tag}>\n')
+    else:
+        write('>\n')
+        child_indent = indent + '  '
+        for node in nodes:
+            if isinstance(node, str):
+                write(f'{child_indent}{__escape_xml(node)}\n')
+            else:
+                __write_xml_element(write, node, child_indent)
+        write(f'{indent}</{element.tag}>\n')
 
 
 def get_deep(_dict, keys, default=None):
@@ -102,11 +159,33 @@ def get_content_type(file_path):
     kind = filetype.guess(file_path)
     if kind is not None:
         return kind.mime
-    return None
+    return mimetypes.guess_type(file_path)[0]
+
+
+def hash_file(file_path, block_size=1048576):
+    """
+        content hash of the file, read block by block
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as binary_file:
+        for block in iter(lambda: binary_file.read(block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def encode_to_json(obj, backend='json'):
+    """
+        encode records, cells and pages to json, the same way as jsonpickle with unpicklable=False
+    """
+    if backend == 'orjson' and orjson is not None:
+        return orjson.dumps(obj, default=__get_json_state).decode('utf8')
+    return json.dumps(obj, default=__get_json_state)
 
 
-def encode_to_json(obj):
-    return jsonpickle.encode(obj, unpicklable=False)
+def __get_json_state(obj):
+    if hasattr(obj, '__getstate__'):
+        return obj.__getstate__()
+    return vars(obj)
 
 
 def decode_from_json(json):
@@ -0,0 +1,127 @@
+"""
+    Watchers of the files written in a directory.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import logging
+
+# inotify(7) flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+logger = logging.getLogger(__name__)
+
+
+class InotifyWatcher:
+    """
+        Files written or moved into the directory, told by inotify of Linux.
+    """
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f'Cannot watch {directory}')
+
+    def poll(self, timeout=None):
+        """ Wait for files to be written.
+
+            :return: Set of the file names, empty when the timeout passed
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+
+        names = set()
+        data = os.read(self.fd, 65536)
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+        Files of the directory whose size or modification time changed, found by scanning it.
+    """
+
+    def __init__(self, directory, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self.files = self.__scan()
+
+    def poll(self, timeout=None):
+        """ Wait for files to be written.
+
+            :return: Set of the file names, empty when the timeout passed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            files = self.__scan()
+            names = {name for name, state in files.items() if self.files.get(name) != state}
+            self.files = files
+            if names:
+                return names
+
+            remaining = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            if remaining <= 0:
+                return set()
+            time.sleep(remaining)
+
+    def close(self):
+        pass
+
+    def __scan(self):
+        files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+
+def open_watcher(directory, interval=1.0):
+    """ Watch the directory with inotify where available, by scanning it otherwise.
+
+        :return: InotifyWatcher or PollingWatcher
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as error:
+            logger.warning(f'inotify is not available ({error}), {directory} is scanned every {interval}s')
+    return PollingWatcher(directory, interval)
+
+
+def wait_changes(watcher, settle=0.5):
+    """ Wait for files to be written, until none was written for settle seconds.
+
+        :return: Set of the file names
+    """
+    names = watcher.poll()
+    while True:
+        more = watcher.poll(settle)
+        if not more:
+            return names
+        names |= more